@@ -11,9 +11,11 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 3
+LIBPATCH = 10
 
 import abc
+import dataclasses
+import functools
 import os
 import pathlib
 import urllib.parse
@@ -33,6 +35,62 @@ class Blocked(Exception):
     """The OpenCTI connector is blocked."""
 
 
+PEER_INTEGRATION_NAME = "opencti-connector-peer"
+# connectors consuming their work from a RabbitMQ queue can run as competing consumers
+MULTI_UNIT_CONNECTOR_TYPES = ("INTERNAL_ENRICHMENT", "INTERNAL_IMPORT_FILE")
+# RabbitMQ queue size, in MB, above which importing connectors buffer their bundles, for each
+# backpressure level published by the OpenCTI charm, the connector default is 500
+BACKPRESSURE_QUEUE_THRESHOLDS = {"elevated": 100, "high": 10}
+# configuration options used by the charm itself, not passed to the connector
+CHARM_OPTIONS = ("connector-processes",)
+
+# the C YAML loader is much faster, fall back to the pure Python loader if libyaml is missing
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@dataclasses.dataclass(frozen=True)
+class ConnectorOption:
+    """A connector charm configuration option.
+
+    Attributes:
+        name: the configuration option name.
+        required: whether the configuration option must be set.
+    """
+
+    name: str
+    required: bool
+
+
+@functools.lru_cache(maxsize=None)
+def load_config_options(charm_dir: pathlib.Path) -> tuple[ConnectorOption, ...]:
+    """Load the configuration options of a connector charm, once per process.
+
+    The config.yaml generated by charmcraft in the packed charm is preferred over the full
+    charmcraft.yaml, which is only parsed when running from the source tree.
+
+    Args:
+        charm_dir: the charm directory.
+
+    Returns:
+        The configuration options of the charm.
+
+    Raises:
+        RuntimeError: If charm metadata file doesn't exist.
+    """
+    config_file = charm_dir / "config.yaml"
+    if config_file.exists():
+        options = yaml.load(config_file.read_text(), Loader=_YamlLoader)["options"]
+    else:
+        config_file = charm_dir / "charmcraft.yaml"
+        if not config_file.exists():
+            raise RuntimeError("charm configuration metadata doesn't exist")
+        options = yaml.load(config_file.read_text(), Loader=_YamlLoader)["config"]["options"]
+    return tuple(
+        ConnectorOption(name=name, required=meta.get("optional") is False)
+        for name, meta in options.items()
+    )
+
+
 class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
     """OpenCTI connector base charm."""
 
@@ -57,13 +115,17 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
         super().__init__(*args)
 
         self._log_forwarder = LogForwarder(self)
+        # only follow new secret revisions on secret-changed, other hooks use the tracked one
+        self._refresh_secrets = False
 
         self.framework.observe(self.on.config_changed, self._reconcile)
         self.framework.observe(self.on["opencti-connector"].relation_changed, self._reconcile)
-        self.framework.observe(self.on.secret_changed, self._reconcile)
+        self.framework.observe(self.on.secret_changed, self._on_secret_changed)
         self.framework.observe(self.on.upgrade_charm, self._reconcile)
         self.framework.observe(self.on[self.meta.name].pebble_ready, self._reconcile)
         self.framework.observe(self.on.update_status, self._reconcile)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on[PEER_INTEGRATION_NAME].relation_changed, self._reconcile)
 
     @property
     def boolean_style(self) -> str:
@@ -75,22 +137,13 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
         """
         return "json"
 
-    def _config_metadata(self) -> dict:
-        """Get charm configuration metadata.
+    def _config_options(self) -> tuple[ConnectorOption, ...]:
+        """Get the charm configuration options.
 
         Returns:
-            The charm configuration metadata.
-
-        Raises:
-            RuntimeError: If charm metadata file doesn't exist.
+            The charm configuration options, shared by the validation and the environment.
         """
-        config_file = self.charm_dir / "config.yaml"
-        if config_file.exists():
-            return yaml.safe_load(config_file.read_text())["options"]
-        config_file = self.charm_dir / "charmcraft.yaml"
-        if config_file.exists():
-            return yaml.safe_load(config_file.read_text())["config"]["options"]
-        raise RuntimeError("charm configuration metadata doesn't exist")
+        return load_config_options(self.charm_dir)
 
     def kebab_to_constant(self, name: str) -> str:
         """Convert kebab case to constant case
@@ -110,10 +163,9 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
             NotReady: If some charm configurations isn't ready.
         """
         missing = []
-        for config, config_meta in self._config_metadata().items():
-            value = self.config.get(config)
-            if value is None and config_meta.get("optional") is False:
-                missing.append(config)
+        for option in self._config_options():
+            if option.required and self.config.get(option.name) is None:
+                missing.append(option.name)
         if missing:
             raise NotReady("missing configurations: {}".format(", ".join(missing)))
 
@@ -127,14 +179,46 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
         if integration is None:
             raise NotReady("missing opencti-connector integration")
 
+    @property
+    def multi_unit(self) -> bool:
+        """Whether every unit of the charm runs the connector.
+
+        Connectors of other types only run on the leader unit.
+
+        Returns: True if the connector runs on every unit.
+        """
+        return self.connector_type in MULTI_UNIT_CONNECTOR_TYPES
+
+    def _on_secret_changed(self, event: ops.SecretChangedEvent) -> None:
+        """Reconcile the charm with the latest revision of the secrets.
+
+        Args:
+            event: the secret-changed event.
+        """
+        self._refresh_secrets = True
+        self._reconcile(event)
+
+    def _on_leader_elected(self, event: ops.LeaderElectedEvent) -> None:
+        """Take over the connector from the previous leader.
+
+        Writing the new leader to the peer integration triggers a relation-changed event on
+        the previous leader, which stops its connector if the connector only runs on the leader.
+
+        Args:
+            event: the leader-elected event.
+        """
+        peer_integration = self.model.get_relation(PEER_INTEGRATION_NAME)
+        if peer_integration:
+            peer_integration.data[self.app]["active-unit"] = self.unit.name
+        self._reconcile(event)
+
     def _reconcile(self, _) -> None:
         """Reconcile the charm."""
         try:
-            if self.app.planned_units() != 1:
-                self.unit.status = ops.BlockedStatus(
-                    "connector charm cannot have multiple units, "
-                    "scale down using the `juju scale` command"
-                )
+            # standby units stop their connector even with an invalid configuration
+            if not self.multi_unit and not self.unit.is_leader():
+                self._stop_connector()
+                self.unit.status = ops.ActiveStatus("standby, the connector runs on the leader")
                 return
             self._check_config()
             self._check_integration()
@@ -147,7 +231,11 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
             self.unit.status = ops.BlockedStatus(str(exc))
 
     def _reconcile_integration(self) -> None:
-        """Reconcile the charm integrations."""
+        """Reconcile the charm integrations.
+
+        The leader shares the connector ID with the other units through the peer integration,
+        every unit of the charm runs as the same OpenCTI connector.
+        """
         if self.unit.is_leader():
             integration = self.model.get_relation("opencti-connector")
             data = integration.data[self.app]
@@ -157,8 +245,34 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
                     "connector_type": self.connector_type,
                 }
             )
-            if "connector_id" not in data:
-                data["connector_id"] = str(uuid.uuid4())
+            peer_integration = self.model.get_relation(PEER_INTEGRATION_NAME)
+            peer_data = peer_integration.data[self.app] if peer_integration else {}
+            connector_id = (
+                peer_data.get("connector_id") or data.get("connector_id") or str(uuid.uuid4())
+            )
+            data["connector_id"] = connector_id
+            if peer_integration:
+                peer_integration.data[self.app]["connector_id"] = connector_id
+
+    def _get_connector_id(self) -> str:
+        """Get the OpenCTI connector ID shared by all units.
+
+        Returns:
+            The connector ID.
+
+        Raises:
+            NotReady: If the leader hasn't shared the connector ID yet.
+        """
+        peer_integration = self.model.get_relation(PEER_INTEGRATION_NAME)
+        connector_id = (
+            peer_integration.data[self.app].get("connector_id") if peer_integration else None
+        )
+        if connector_id:
+            return connector_id
+        if self.unit.is_leader():
+            integration = self.model.get_relation("opencti-connector")
+            return integration.data[self.app]["connector_id"]
+        raise NotReady("waiting for connector id from the leader")
 
     def _gen_env(self) -> dict[str, str]:
         """Generate environment variables for the opencti connector service.
@@ -175,27 +289,49 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
         if not opencti_url or not opencti_token_id:
             raise NotReady("waiting for opencti-connector integration")
         opencti_token_secret = self.model.get_secret(id=opencti_token_id)
-        opencti_token = opencti_token_secret.get_content(refresh=True)["token"]
+        opencti_token = opencti_token_secret.get_content(refresh=self._refresh_secrets)["token"]
         environment = {
             "OPENCTI_URL": opencti_url,
             "OPENCTI_TOKEN": opencti_token,
-            "CONNECTOR_ID": integration.data[self.app]["connector_id"],
+            "CONNECTOR_ID": self._get_connector_id(),
             "CONNECTOR_NAME": self.app.name,
             "CONNECTOR_TYPE": self.connector_type,
         }
 
-        for config, config_meta in self._config_metadata().items():
-            value = self.config.get(config)
-            if value is None:
+        for option in self._config_options():
+            value = self.config.get(option.name)
+            if value is None or option.name in CHARM_OPTIONS:
                 continue
-            environment[self.kebab_to_constant(config)] = str(value)
+            env = self.kebab_to_constant(option.name)
+            environment[env] = str(value)
             if self.boolean_style == "json" and isinstance(value, bool):
-                environment[self.kebab_to_constant(config)] = str(value).lower()
+                environment[env] = str(value).lower()
 
+        environment.update(self._get_backpressure_environment(integration_data))
         environment.update(self._get_proxy_environment(opencti_url))
 
         return environment
 
+    def _get_backpressure_environment(self, integration_data: ops.RelationDataContent) -> dict:
+        """Get the environment variables throttling the connector under platform backpressure.
+
+        Importing connectors go into buffering mode at a lower queue size while the OpenCTI
+        workers are saturated, a lower configured queue threshold is kept.
+
+        Args:
+            integration_data: opencti-connector integration data of the OpenCTI application.
+
+        Returns:
+            backpressure environment variables.
+        """
+        threshold = BACKPRESSURE_QUEUE_THRESHOLDS.get(integration_data.get("backpressure", ""))
+        if self.connector_type != "EXTERNAL_IMPORT" or threshold is None:
+            return {}
+        configured = self.config.get("connector-queue-threshold")
+        if isinstance(configured, int):
+            threshold = min(threshold, configured)
+        return {"CONNECTOR_QUEUE_THRESHOLD": str(threshold)}
+
     def _get_proxy_environment(self, opencti_url: str) -> dict[str, str]:
         """Get proxy environment variables.
 
@@ -223,30 +359,92 @@ class OpenctiConnectorCharm(ops.CharmBase, abc.ABC):
             environment["no_proxy"] = ",".join(no_proxy_list)
         return environment
 
+    def _stop_connector(self) -> None:
+        """Stop the connector service, if it's running."""
+        container = self.unit.get_container(self.meta.name)
+        if not container.can_connect() or "connector" not in container.get_plan().services:
+            return
+        if container.get_service("connector").is_running():
+            container.stop("connector")
+
+    def _get_connector_processes(self) -> int:
+        """Get the number of connector processes in this unit.
+
+        Returns:
+            The number of connector processes, always 1 for connectors that don't consume
+            their work from a queue.
+
+        Raises:
+            Blocked: If the connector-processes configuration is invalid.
+        """
+        if not self.multi_unit:
+            return 1
+        processes = self.config.get("connector-processes", 1)
+        if not isinstance(processes, int) or processes < 1:
+            raise Blocked("invalid charm config: connector-processes")
+        return processes
+
     def _reconcile_connector(self) -> None:
-        """Reconcile connector service."""
+        """Reconcile connector services.
+
+        The first connector process runs as the "connector" service, additional processes as
+        "connector-1", "connector-2"... all registered as the same OpenCTI connector.
+        """
         container = self.unit.get_container(self.meta.name)
         if not container.can_connect():
             raise NotReady("waiting for container ready")
-        container.add_layer(
-            "connector",
-            layer=ops.pebble.LayerDict(
-                summary=self.meta.name,
-                description=self.meta.name,
-                services={
-                    "connector": {
-                        "startup": "enabled",
-                        "on-failure": "restart",
-                        "override": "replace",
-                        "command": "bash /entrypoint.sh",
-                        "environment": self._gen_env(),
-                    },
-                },
-            ),
-            combine=True,
+        processes = self._get_connector_processes()
+        names = ["connector"] + [f"connector-{i}" for i in range(1, processes)]
+        plan = container.get_plan()
+        # services can't be removed from the pebble plan, disable the surplus ones instead
+        surplus = [
+            name for name in plan.services if name.startswith("connector-") and name not in names
+        ]
+        if surplus:
+            surplus_services = container.get_services(*surplus).values()
+            if running := [s.name for s in surplus_services if s.is_running()]:
+                container.stop(*running)
+        service: ops.pebble.ServiceDict = {
+            "startup": "enabled",
+            "on-failure": "restart",
+            "override": "replace",
+            "command": "bash /entrypoint.sh",
+            "environment": self._gen_env(),
+        }
+        services = {name: service for name in names}
+        services.update(
+            {
+                name: {
+                    "override": "replace",
+                    "summary": "surplus connector process, disabled",
+                    "command": "bash /entrypoint.sh",
+                    "startup": "disabled",
+                }
+                for name in surplus
+            }
+        )
+        changed = any(
+            name not in plan.services
+            or plan.services[name].to_dict() != ops.pebble.Service(name, service).to_dict()
+            for name, service in services.items()
         )
         try:
-            container.replan()
-            container.start("connector")
+            # replanning restarts the connectors, only do it when the services have changed
+            if changed:
+                container.add_layer(
+                    "connector",
+                    layer=ops.pebble.LayerDict(
+                        summary=self.meta.name,
+                        description=self.meta.name,
+                        services=services,
+                    ),
+                    combine=True,
+                )
+                container.replan()
+            stopped = [
+                s.name for s in container.get_services(*names).values() if not s.is_running()
+            ]
+            if stopped:
+                container.start(*stopped)
         except ops.pebble.ChangeError as exc:
             raise Blocked("failed to start connector, will retry") from exc
@@ -0,0 +1,57 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Benchmark the cold start latency of the OpenCTI client schema loading.
+
+Each sample runs in a new Python process to simulate a cold charm hook.
+
+Usage: PYTHONPATH=src python3 scripts/benchmark_opencti_schema.py [samples]
+"""
+
+import pathlib
+import shutil
+import statistics
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+
+_SRC = pathlib.Path(__file__).parent.parent / "src"
+# loading the schema and validating the operations happens before the first query
+_HOOK = "import opencti\nopencti.validate_operations()\n"
+
+
+def measure(workdir: pathlib.Path, samples: int) -> list[float]:
+    """Measure the cold start latency of the OpenCTI client.
+
+    Args:
+        workdir: directory containing the OpenCTI client module and schema.
+        samples: number of samples.
+
+    Returns:
+        latency of each sample in seconds.
+    """
+    result = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", _HOOK], cwd=workdir, check=True)  # nosec
+        result.append(time.perf_counter() - start)
+    return result
+
+
+def main() -> None:
+    """Run the benchmark."""
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = pathlib.Path(tmp)
+        shutil.copy(_SRC / "opencti.py", workdir)
+        shutil.copy(_SRC / "opencti.pruned.graphql", workdir)
+        before = measure(workdir, samples)
+        subprocess.run([sys.executable, "opencti.py"], cwd=workdir, check=True)  # nosec
+        after = measure(workdir, samples)
+    print(f"SDL schema:           median {statistics.median(before):.3f}s")
+    print(f"serialized schema:    median {statistics.median(after):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -40,6 +40,17 @@ DEFAULT_CONFIG = {
     },
 }
 
+QUEUE_CONNECTOR_TYPES = {"INTERNAL_ENRICHMENT", "INTERNAL_IMPORT_FILE"}
+
+QUEUE_CONNECTOR_CONFIG = {
+    "connector-processes": {
+        "type": "int",
+        "description": "number of connector processes running in each unit, consuming from the same connector queue",
+        "default": 1,
+        "optional": False,
+    },
+}
+
 CHARM_MANAGED_ENV = {
     "OPENCTI_URL",
     "OPENCTI_TOKEN",
@@ -165,6 +176,8 @@ def render_template(
         raise ValueError(f"connector name should be in kebab case: {name}")
     connector_name = connector_name or name
     display_name_short = display_name_short or display_name
+    if connector_type in QUEUE_CONNECTOR_TYPES:
+        config = {**config, **QUEUE_CONNECTOR_CONFIG}
     output_dir.mkdir(exist_ok=True)
 
     output = output_dir / "rock" / "rockcraft.yaml"
@@ -0,0 +1,186 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Generate the pruned OpenCTI GraphQL schema used by the OpenCTI client.
+
+The OpenCTI client only uses a handful of operations from the 12k+ lines OpenCTI schema.
+This script walks the static GraphQL operations in src/opencti.py and writes a schema
+containing only the types and fields reachable from those operations to
+src/opencti.pruned.graphql.
+
+Usage: PYTHONPATH=src python3 scripts/gen_opencti_schema.py [--check]
+
+With --check, exit with a non-zero status if the pruned schema is outdated, for example
+when a new query references a type or a field outside the pruned schema.
+"""
+
+import argparse
+import pathlib
+import sys
+import typing
+
+import graphql
+
+import opencti
+
+_SRC = pathlib.Path(__file__).parent.parent / "src"
+FULL_SCHEMA_PATH = _SRC / "opencti.graphql"
+PRUNED_SCHEMA_PATH = _SRC / "opencti.pruned.graphql"
+
+_NodeT = typing.TypeVar("_NodeT", bound=graphql.language.Node)
+
+_HEADER = "# Generated by scripts/gen_opencti_schema.py from opencti.graphql, do not edit.\n\n"
+
+
+def collect_references(
+    schema: graphql.GraphQLSchema, documents: typing.Iterable[graphql.DocumentNode]
+) -> dict[str, set[str]]:
+    """Collect the schema fields referenced by GraphQL operations.
+
+    Args:
+        schema: the full OpenCTI GraphQL schema.
+        documents: GraphQL operations.
+
+    Returns:
+        a mapping from type names to the referenced field names.
+    """
+    references: dict[str, set[str]] = {}
+    type_info = graphql.TypeInfo(schema)
+
+    class _Visitor(graphql.Visitor):
+        """Record the parent type of every selected field."""
+
+        def enter_field(self, node: graphql.FieldNode, *_: typing.Any) -> None:
+            """Record a selected field.
+
+            Args:
+                node: field node.
+
+            Raises:
+                ValueError: if the field is not in the schema.
+            """
+            parent = type_info.get_parent_type()
+            if parent is None or type_info.get_field_def() is None:
+                raise ValueError(f"unknown field {node.name.value}")
+            references.setdefault(parent.name, set()).add(node.name.value)
+
+    for document in documents:
+        graphql.visit(document, graphql.TypeInfoVisitor(type_info, _Visitor()))
+    return references
+
+
+def _strip(node: _NodeT) -> _NodeT:
+    """Remove directives and descriptions from a schema definition node.
+
+    Args:
+        node: schema definition node.
+
+    Returns:
+        a copy of the node without directives and descriptions.
+    """
+    node = type(node)(**{k: getattr(node, k) for k in node.keys})
+    if "directives" in node.keys:
+        node.directives = ()
+    if "description" in node.keys:
+        node.description = None
+    for attr in ("fields", "arguments", "values"):
+        if getattr(node, attr, None):
+            setattr(node, attr, tuple(_strip(child) for child in getattr(node, attr)))
+    return node
+
+
+def _named_type(type_node: graphql.language.TypeNode) -> str:
+    """Get the name of the named type wrapped by list and non-null types.
+
+    Args:
+        type_node: type node.
+
+    Returns:
+        the named type name.
+    """
+    while not isinstance(type_node, graphql.language.NamedTypeNode):
+        type_node = type_node.type  # type: ignore[attr-defined]
+    return type_node.name.value
+
+
+def prune_schema(full_schema: str, references: dict[str, set[str]]) -> str:
+    """Prune the OpenCTI GraphQL schema to the referenced types and fields.
+
+    Object types only keep the referenced fields, all other reachable types are kept whole.
+
+    Args:
+        full_schema: the full OpenCTI GraphQL schema.
+        references: a mapping from object type names to the referenced field names.
+
+    Returns:
+        the pruned schema.
+
+    Raises:
+        ValueError: if the references contain types or fields not in the full schema.
+    """
+    definitions = {
+        definition.name.value: definition
+        for definition in graphql.parse(full_schema, no_location=True).definitions
+        if isinstance(definition, graphql.language.TypeDefinitionNode)
+    }
+    pruned: dict[str, graphql.language.TypeDefinitionNode] = {}
+    pending = []
+    for type_name, field_names in references.items():
+        definition = definitions.get(type_name)
+        if not isinstance(definition, graphql.language.ObjectTypeDefinitionNode):
+            raise ValueError(f"unknown object type {type_name}")
+        fields = [f for f in definition.fields if f.name.value in field_names]
+        if unknown := field_names - {f.name.value for f in fields}:
+            raise ValueError(f"unknown field(s) {', '.join(sorted(unknown))} in {type_name}")
+        node = _strip(definition)
+        node.fields = tuple(_strip(f) for f in fields)
+        node.interfaces = ()
+        pruned[type_name] = node
+        for field in fields:
+            pending.append(_named_type(field.type))
+            pending.extend(_named_type(arg.type) for arg in field.arguments)
+    while pending:
+        type_name = pending.pop()
+        if type_name in pruned or type_name in graphql.specified_scalar_types:
+            continue
+        definition = definitions[type_name]
+        if isinstance(definition, graphql.language.ObjectTypeDefinitionNode):
+            raise ValueError(f"object type {type_name} is selected but none of its fields")
+        pruned[type_name] = _strip(definition)
+        if isinstance(definition, graphql.language.InputObjectTypeDefinitionNode):
+            pending.extend(_named_type(f.type) for f in definition.fields)
+    document = graphql.language.DocumentNode(
+        definitions=tuple(pruned[name] for name in sorted(pruned))
+    )
+    graphql.build_ast_schema(document)
+    return _HEADER + graphql.print_ast(document) + "\n"
+
+
+def generate() -> str:
+    """Generate the pruned OpenCTI GraphQL schema.
+
+    Returns:
+        the pruned schema.
+    """
+    full_schema = FULL_SCHEMA_PATH.read_text(encoding="utf-8")
+    references = collect_references(
+        graphql.build_schema(full_schema, assume_valid_sdl=True), opencti.OPERATIONS.values()
+    )
+    return prune_schema(full_schema, references)
+
+
+def main() -> None:
+    """Entrypoint."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--check", action="store_true", help="check the pruned schema")
+    args = parser.parse_args()
+    schema = generate()
+    if not args.check:
+        PRUNED_SCHEMA_PATH.write_text(schema, encoding="utf-8")
+        return
+    if not PRUNED_SCHEMA_PATH.exists() or PRUNED_SCHEMA_PATH.read_text() != schema:
+        sys.exit(f"{PRUNED_SCHEMA_PATH} is outdated, run scripts/gen_opencti_schema.py")
+
+
+if __name__ == "__main__":
+    main()
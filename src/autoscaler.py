@@ -0,0 +1,109 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""OpenCTI worker autoscaler and connector backpressure based on the RabbitMQ queue backlog."""
+
+import math
+import urllib.parse
+
+import requests
+
+# OpenCTI workers consume the messages in the push_* queues
+PUSH_QUEUE_PREFIX = "push_"
+# remove a worker only when the remaining workers would be at most half busy
+_SCALE_DOWN_RATIO = 0.5
+# backpressure levels published to the connectors, from no to maximum backpressure
+BACKPRESSURE_LEVELS = ("none", "elevated", "high")
+# backlog entering each backpressure level, in multiples of the worker capacity
+_BACKPRESSURE_THRESHOLDS = (0, 2, 8)
+
+
+def get_queue_backlog(
+    url: str, username: str, password: str, prefix: str = PUSH_QUEUE_PREFIX, timeout: float = 5
+) -> int:
+    """Get the number of messages in the RabbitMQ queues using the management API.
+
+    Args:
+        url: URL of the RabbitMQ management API.
+        username: RabbitMQ user name.
+        password: RabbitMQ user password.
+        prefix: only count the messages in queues with names starting with this prefix.
+        timeout: request timeout in seconds.
+
+    Returns:
+        number of messages in the queues.
+    """
+    response = requests.get(
+        urllib.parse.urljoin(url, "/api/queues"),
+        # only fetch the required columns, the queue details can be large
+        params={"columns": "name,messages"},
+        auth=(username, password),
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    return sum(
+        queue.get("messages") or 0
+        for queue in response.json()
+        if queue.get("name", "").startswith(prefix)
+    )
+
+
+def compute_worker_count(
+    current: int, backlog: int, minimum: int, maximum: int, messages_per_worker: int
+) -> int:
+    """Compute the number of workers for a queue backlog.
+
+    Workers are added as soon as the backlog exceeds the target number of messages per worker,
+    but removed one at a time, and only when the backlog is well below the capacity of the
+    remaining workers, so the worker count doesn't flap around a threshold.
+
+    Args:
+        current: current number of workers.
+        backlog: number of messages waiting in the queues.
+        minimum: minimum number of workers.
+        maximum: maximum number of workers.
+        messages_per_worker: target number of queued messages per worker.
+
+    Returns:
+        the new number of workers.
+    """
+    desired = math.ceil(backlog / messages_per_worker)
+    if desired > current:
+        target = desired
+    elif backlog < (current - 1) * messages_per_worker * _SCALE_DOWN_RATIO:
+        target = current - 1
+    else:
+        target = current
+    return max(minimum, min(maximum, target))
+
+
+def compute_backpressure(
+    current: str, backlog: int, workers: int, messages_per_worker: int
+) -> str:
+    """Compute the connector backpressure level for a queue backlog.
+
+    The backpressure is raised as soon as the backlog exceeds the threshold of a level, but
+    relieved one level at a time, and only when the backlog is well below the threshold of the
+    current level, so the connectors aren't reconfigured around a threshold.
+
+    Args:
+        current: current backpressure level.
+        backlog: number of messages waiting in the queues.
+        workers: number of workers consuming the queues.
+        messages_per_worker: target number of queued messages per worker.
+
+    Returns:
+        the new backpressure level, one of BACKPRESSURE_LEVELS.
+    """
+    capacity = max(workers, 1) * messages_per_worker
+    level = BACKPRESSURE_LEVELS.index(current) if current in BACKPRESSURE_LEVELS else 0
+    target = max(
+        index
+        for index, threshold in enumerate(_BACKPRESSURE_THRESHOLDS)
+        if backlog >= threshold * capacity
+    )
+    if target > level:
+        return BACKPRESSURE_LEVELS[target]
+    if level > 0 and backlog < _BACKPRESSURE_THRESHOLDS[level] * capacity * _SCALE_DOWN_RATIO:
+        return BACKPRESSURE_LEVELS[level - 1]
+    return BACKPRESSURE_LEVELS[level]
@@ -5,11 +5,19 @@
 
 """OpenCTI charm."""
 
+# pylint: disable=too-many-lines
+
+import asyncio
+import functools
+import hashlib
 import json
 import logging
+import math
+import os
 import pathlib
+import re
 import secrets
-import textwrap
+import time
 import typing
 import urllib.parse
 import uuid
@@ -25,6 +33,7 @@ from charms.rabbitmq_k8s.v0.rabbitmq import RabbitMQRequires
 from charms.redis_k8s.v0.redis import RedisRelationCharmEvents, RedisRequires
 from charms.traefik_k8s.v2.ingress import IngressPerAppRequirer
 
+import autoscaler
 import opencti
 
 logger = logging.getLogger(__name__)
@@ -63,10 +72,86 @@ _PEER_INTEGRATION_NAME = "opencti-peer"
 _PEER_SECRET_FIELD = "secret"  # nosec
 _PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD = "admin-token"  # nosec
 _PEER_SECRET_HEALTH_ACCESS_KEY_SECRET_FIELD = "health-access-key"  # nosec
-_CHARM_CALLBACK_SCRIPT_PATH = pathlib.Path("/opt/opencti/charm-callback.sh")
+_PEER_RESTART_REQUEST_FIELD = "restart-request"
+_PEER_RESTART_UNIT_FIELD = "restart-unit"
 _OPENSEARCH_CERT_PATH = pathlib.Path("/opt/opencti/config/opensearch.pem")
 _OPENCTI_CONNECTOR_USER_PREFIX = "charm-connector-"
 _OPENCTI_BASE_URL = "http://localhost:8080/"
+_PLATFORM_PORT = 8080
+_PLATFORM_METRICS_PORT = 14269
+# the managers process doesn't serve the API, its port is only used for health checks
+_PLATFORM_MANAGERS_PORT = 8079
+_PLATFORM_MANAGERS_METRICS_PORT = 14268
+# background managers of the OpenCTI platform, disabled in the API-only processes
+_OPENCTI_MANAGER_FLAGS = (
+    "ACTIVITY_MANAGER__ENABLED",
+    "CONNECTOR_MANAGER__ENABLED",
+    "EXPIRATION_SCHEDULER__ENABLED",
+    "FILE_INDEX_MANAGER__ENABLED",
+    "GARBAGE_COLLECTION_MANAGER__ENABLED",
+    "HISTORY_MANAGER__ENABLED",
+    "IMPORT_CSV_BUILT_IN_CONNECTOR__ENABLED",
+    "INDICATOR_DECAY_MANAGER__ENABLED",
+    "INGESTION_MANAGER__ENABLED",
+    "NOTIFICATION_MANAGER__ENABLED",
+    "PLAYBOOK_MANAGER__ENABLED",
+    "PUBLISHER_MANAGER__ENABLED",
+    "RETENTION_MANAGER__ENABLED",
+    "RULE_ENGINE__ENABLED",
+    "SYNC_MANAGER__ENABLED",
+    "TASK_SCHEDULER__ENABLED",
+    "TELEMETRY_MANAGER__ENABLED",
+)
+_CHARM_BALANCER_SCRIPT_PATH = pathlib.Path("/opt/opencti/charm-balancer.js")
+# round-robin TCP balancer in front of the platform processes
+_CHARM_BALANCER_SCRIPT = """\
+const net = require("net");
+const backends = process.env.BACKEND_PORTS.split(",").map(Number);
+let next = 0;
+net
+  .createServer((client) => {
+    const upstream = net.connect(backends[next], "127.0.0.1");
+    next = (next + 1) % backends.length;
+    client.pipe(upstream).pipe(client);
+    client.on("error", () => upstream.destroy());
+    upstream.on("error", () => client.destroy());
+  })
+  .listen(Number(process.env.LISTEN_PORT));
+"""
+_CHARM_WORKER_CHECK_SCRIPT_PATH = pathlib.Path("/opt/opencti-worker/charm-worker-check.py")
+# worker liveness check, the worker can reach the platform with its token
+_CHARM_WORKER_CHECK_SCRIPT = """\
+import json
+import os
+import urllib.request
+
+request = urllib.request.Request(
+    os.environ["OPENCTI_URL"].rstrip("/") + "/graphql",
+    data=json.dumps({"query": "{ me { id } }"}).encode(),
+    headers={
+        "Authorization": "Bearer " + os.environ["OPENCTI_TOKEN"],
+        "Content-Type": "application/json",
+    },
+)
+with urllib.request.urlopen(request, timeout=10) as response:
+    if json.load(response).get("errors"):
+        raise SystemExit(1)
+"""
+_CGROUP_CPU_MAX_PATH = pathlib.Path("/sys/fs/cgroup/cpu.max")
+_CGROUP_MEMORY_MAX_PATH = pathlib.Path("/sys/fs/cgroup/memory.max")
+# used when the container has no memory limit
+_DEFAULT_PLATFORM_HEAP_MIB = 8096
+_MIN_PLATFORM_HEAP_MIB = 512
+# the connector users can also be changed in the OpenCTI UI, refresh them from time to time
+_CONNECTOR_USER_CACHE_TTL = 3600
+# detect the platform start-up and failures within a few seconds
+_PLATFORM_CHECK_PERIOD = 3
+_PLATFORM_CHECK_TIMEOUT = 2
+_PLATFORM_CHECK_THRESHOLD = 2
+# restart a stuck worker after a few minutes
+_WORKER_CHECK_PERIOD = 60
+_WORKER_CHECK_TIMEOUT = 15
+_WORKER_CHECK_THRESHOLD = 3
 
 
 # caused by charm libraries
@@ -79,6 +164,7 @@ class OpenCTICharm(ops.CharmBase):
     """
 
     on = RedisRelationCharmEvents()
+    _stored = ops.StoredState()
 
     def __init__(self, *args: typing.Any):
         """Construct.
@@ -97,32 +183,54 @@ class OpenCTICharm(ops.CharmBase):
         self._ingress = self._register_ingress()
         self._log_forwarder = LogForwarder(self)
         self._grafana_dashboards = GrafanaDashboardProvider(self)
+        processes = typing.cast(int, self.config.get("platform-processes", 1))
+        metrics_ports = (
+            [_PLATFORM_METRICS_PORT + 1 + i for i in range(processes)]
+            if processes > 1
+            else [_PLATFORM_METRICS_PORT]
+        )
+        if self._get_split_managers():
+            metrics_ports.append(_PLATFORM_MANAGERS_METRICS_PORT)
         self._metrics_endpoint = MetricsEndpointProvider(
             self,
             jobs=[
                 {
                     "job_name": "opencti_metrics",
-                    "static_configs": [{"targets": ["*:14269"]}],
+                    "static_configs": [{"targets": [f"*:{port}" for port in metrics_ports]}],
                 }
             ],
+            refresh_event=[self.on.opencti_pebble_ready, self.on.config_changed],
         )
         self._peer_secret: dict[str, str] = {}
+        self._stored.set_default(
+            connector_users={},
+            connector_users_expiry=0.0,
+            connector_integrations_hash="",
+            connector_reconcile_count=0,
+            connector_fast_path_count=0,
+            autoscaled_worker_count=0,
+            connector_backpressure=autoscaler.BACKPRESSURE_LEVELS[0],
+            platform_check_started=0.0,
+        )
 
         self.framework.observe(self.on.config_changed, self._reconcile)
         self.framework.observe(self.on.upgrade_charm, self._reconcile)
-        self.framework.observe(self.on.update_status, self._reconcile)
+        self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.secret_changed, self._reconcile)
         self.framework.observe(self.on.opencti_pebble_ready, self._reconcile)
         self.framework.observe(self.on.opencti_peer_relation_created, self._reconcile)
         self.framework.observe(self.on.opencti_peer_relation_changed, self._reconcile)
         self.framework.observe(self.on.opencti_peer_relation_departed, self._reconcile)
-        self.framework.observe(
-            self.on["opencti"].pebble_custom_notice, self._on_pebble_custom_notice
-        )
+        self.framework.observe(self.on.opencti_pebble_check_failed, self._on_pebble_check_failed)
+        self.framework.observe(self.on.opencti_pebble_check_recovered, self._reconcile)
         self.framework.observe(self.on.opencti_peer_relation_broken, self._cleanup_secrets)
         self.framework.observe(self.on.stop, self._cleanup_secrets)
         self.framework.observe(self.on.opencti_connector_relation_joined, self._reconcile)
         self.framework.observe(self.on.opencti_connector_relation_changed, self._reconcile)
+        self.framework.observe(self.on.opencti_connector_relation_broken, self._reconcile)
+        self.framework.observe(self.on.opencti_worker_relation_joined, self._reconcile)
+        self.framework.observe(self.on.opencti_platform_relation_changed, self._reconcile)
+        self.framework.observe(self.on.opencti_platform_relation_broken, self._reconcile)
 
     def _register_opensearch(self) -> OpenSearchRequires:
         """Create OpenSearchRequires instance and register related event handlers.
@@ -213,6 +321,26 @@ class OpenCTICharm(ops.CharmBase):
         self.framework.observe(ingress.on.revoked, self._reconcile)
         return ingress
 
+    def _on_pebble_check_failed(self, event: ops.PebbleCheckFailedEvent) -> None:
+        """Handle pebble check failed event, restart a worker failing its liveness check.
+
+        Args:
+            event: Pebble check failed event.
+        """
+        name = event.info.name
+        if re.fullmatch(r"worker-\d+", name) and self._container.can_connect():
+            # the workers of an unhealthy local platform can't reach it either
+            local_platform = "platform" in self._container.get_plan().services
+            service = self._container.get_services(name).get(name)
+            if (
+                service is not None
+                and service.is_running()
+                and (not local_platform or self._is_platform_ready())
+            ):
+                logger.warning("restarting %s, its liveness check failed", name)
+                self._container.restart(name)
+        self._reconcile(event)
+
     def _cleanup_secrets(self, _: ops.EventBase) -> None:
         """Cleanup secrets created by the opencti charm."""
         if not self.unit.is_leader():
@@ -239,17 +367,14 @@ class OpenCTICharm(ops.CharmBase):
         if self.unit.is_leader():
             event.relation.data[self.app]["admin"] = "true"
 
-    def _on_pebble_custom_notice(self, event: ops.PebbleCustomNoticeEvent) -> None:
-        """Handle pebble custom notice event.
+    def _reconcile(self, event: ops.EventBase) -> None:
+        """Run charm reconcile function and catch all exceptions.
 
         Args:
-            event: Pebble custom notice event.
+            event: the event triggering the reconciliation.
         """
-        if event.notice.key.startswith("canonical.com/opencti/"):
-            self._reconcile(event)
-
-    def _reconcile(self, _: ops.EventBase) -> None:
-        """Run charm reconcile function and catch all exceptions."""
+        if isinstance(event, ops.RelationEvent) and event.relation.name == "opencti-connector":
+            self._invalidate_connector_user_cache()
         if isinstance(self._ingress.url, str) and len(self._ingress.url) > 0:
             app_path = urllib.parse.urlparse(self._ingress.url).path
             if len(app_path) > 0 and app_path[0] == "/":
@@ -259,9 +384,14 @@ class OpenCTICharm(ops.CharmBase):
             self._base_url = _OPENCTI_BASE_URL + app_path
 
         try:
-            self._reconcile_platform()
-            self._reconcile_connector()
-            self.unit.status = ops.ActiveStatus()
+            if self._get_role() == "worker":
+                self._reconcile_worker()
+                self.unit.status = ops.ActiveStatus()
+            else:
+                self._reconcile_platform()
+                self._reconcile_connector()
+                self._reconcile_worker_integrations()
+                self.unit.status = ops.ActiveStatus(self._get_platform_heap_status())
         except (MissingIntegration, MissingConfig, InvalidIntegration, InvalidConfig) as exc:
             self.unit.status = ops.BlockedStatus(str(exc))
         except (ContainerNotReady, IntegrationNotReady, PlatformNotReady) as exc:
@@ -274,148 +404,878 @@ class OpenCTICharm(ops.CharmBase):
             PlatformNotReady: failed to start the OpenCTI platform at this moment
         """
         self._init_peer_relation()
+        self._grant_restart_lock()
         self._check_preconditions()
         health_check_token = self._get_peer_secret(_PEER_SECRET_HEALTH_ACCESS_KEY_SECRET_FIELD)
         health_check_url = (
             f"{self._base_url.removesuffix('/')}/health?health_access_key={health_check_token}"
         )
-        self._install_callback_script(health_check_url)
         self._install_opensearch_cert()
-        self._container.add_layer(
-            "opencti",
-            layer=self._gen_pebble_service_plan(),
-            combine=True,
+        processes = self._get_platform_processes()
+        if processes > 1:
+            self._push_if_changed(
+                _CHARM_BALANCER_SCRIPT_PATH, _CHARM_BALANCER_SCRIPT, encoding="utf-8"
+            )
+        plan = self._container.get_plan()
+        platforms = self._plan_numbered_services(
+            plan, "platform", processes if processes > 1 else 0
+        )
+        worker_count = 0 if self._get_role() == "platform" else self._get_worker_count()
+        workers = self._plan_numbered_services(plan, "worker", worker_count)
+        # stop surplus services first, replan would restart them after disabling them
+        self._stop_services(*workers[1])
+        if "charm-callback" in plan.services:
+            self._stop_services("charm-callback")
+        service_layer = self._gen_pebble_service_plan(plan, platforms, workers)
+        # disabling running platform processes counts as a restart
+        restart = self._needs_platform_restart(service_layer, plan)
+        if restart and not self._acquire_restart_lock():
+            raise PlatformNotReady("waiting for rolling restart")
+        self._stop_services(*platforms[1])
+        if not self._get_split_managers() and "platform-managers" in plan.services:
+            self._stop_services("platform-managers")
+        self._add_layer_if_changed(service_layer, plan)
+        self._start_services(
+            *platforms[0],
+            "platform",
+            *(["platform-managers"] if self._get_split_managers() else []),
         )
-        self._container.replan()
-        self._container.start("platform")
 
-        if not self._is_platform_healthy(health_check_url):
-            self._container.start("charm-callback")
+        if workers[0]:
+            self._push_if_changed(
+                _CHARM_WORKER_CHECK_SCRIPT_PATH, _CHARM_WORKER_CHECK_SCRIPT, encoding="utf-8"
+            )
+        if self._add_layer_if_changed(
+            self._gen_pebble_check_plan(plan, health_check_url, platforms, workers), plan
+        ):
+            self._stored.platform_check_started = time.time()
+        if restart:
+            # restart the check so its status reflects the restarted platform
+            self._container.stop_checks("platform")
+            self._container.start_checks("platform")
+            self._stored.platform_check_started = time.time()
+        # the platform check failing and recovering triggers a new reconcile, the lock is
+        # only released once the check has succeeded after the restart
+        if not self._is_platform_ready():
             raise PlatformNotReady("waiting for opencti platform to start")
+        self._release_restart_lock()
+
+        # the workers reconnect on their own, the hook does not wait for them to settle
+        self._start_services(*workers[0], wait=False)
+
+    def _needs_platform_restart(self, layer: ops.pebble.LayerDict, plan: ops.pebble.Plan) -> bool:
+        """Check if applying a service layer restarts running OpenCTI platform processes.
+
+        Args:
+            layer: the service layer.
+            plan: the current Pebble plan.
+
+        Returns:
+            True if a running platform process would be restarted.
+        """
+        changed = [
+            name
+            for name, service in layer.get("services", {}).items()
+            if (name == "platform" or name.startswith("platform-"))
+            and name in plan.services
+            and plan.services[name].to_dict() != ops.pebble.Service(name, service).to_dict()
+        ]
+        if not changed:
+            return False
+        return any(s.is_running() for s in self._container.get_services(*changed).values())
+
+    def _acquire_restart_lock(self) -> bool:
+        """Request the rolling restart lock from the leader through the peer integration.
+
+        Returns:
+            True if this unit holds the lock and can restart the OpenCTI platform.
+        """
+        peer_integration = self.model.get_relation(_PEER_INTEGRATION_NAME)
+        if peer_integration is None or not peer_integration.units:
+            return True
+        peer_integration.data[self.unit][_PEER_RESTART_REQUEST_FIELD] = "true"
+        self._grant_restart_lock()
+        granted = peer_integration.data[self.app].get(_PEER_RESTART_UNIT_FIELD)
+        return granted == self.unit.name
+
+    def _release_restart_lock(self) -> None:
+        """Release the rolling restart lock once the restarted platform is healthy."""
+        peer_integration = self.model.get_relation(_PEER_INTEGRATION_NAME)
+        if peer_integration is None:
+            return
+        if peer_integration.data[self.unit].get(_PEER_RESTART_REQUEST_FIELD):
+            del peer_integration.data[self.unit][_PEER_RESTART_REQUEST_FIELD]
+            self._grant_restart_lock()
+
+    def _grant_restart_lock(self) -> None:
+        """Grant the rolling restart lock to one requesting unit at a time, on the leader.
+
+        The lock is passed to the next requesting unit, by unit number, once the unit holding
+        it has released it or departed.
+        """
+        if not self.unit.is_leader():
+            return
+        peer_integration = self.model.get_relation(_PEER_INTEGRATION_NAME)
+        if peer_integration is None:
+            return
+        requesting = sorted(
+            (
+                unit.name
+                for unit in (self.unit, *peer_integration.units)
+                if peer_integration.data[unit].get(_PEER_RESTART_REQUEST_FIELD)
+            ),
+            key=lambda name: int(name.split("/")[-1]),
+        )
+        granted = peer_integration.data[self.app].get(_PEER_RESTART_UNIT_FIELD, "")
+        if granted in requesting:
+            return
+        next_unit = requesting[0] if requesting else ""
+        if next_unit != granted:
+            peer_integration.data[self.app][_PEER_RESTART_UNIT_FIELD] = next_unit
+
+    def _reconcile_worker(self) -> None:
+        """Run charm reconcile function for worker-only units.
+
+        The workers send the ingested data to the OpenCTI platform of the opencti-platform
+        integration.
+
+        Raises:
+            ContainerNotReady: the OpenCTI container is not ready.
+            MissingIntegration: the opencti-platform integration is missing.
+            IntegrationNotReady: the OpenCTI platform hasn't shared its URL and token yet.
+        """
+        if not self._container.can_connect():
+            raise ContainerNotReady("waiting for opencti container")
+        plan = self._container.get_plan()
+        integration = self.model.get_relation("opencti-platform")
+        if integration is None or integration.app is None:
+            self._stop_services(*self._plan_numbered_services(plan, "worker", 0)[1])
+            raise MissingIntegration("missing integration(s): opencti-platform")
+        integration_data = integration.data[integration.app]
+        opencti_url = integration_data.get("opencti_url")
+        token_secret_id = integration_data.get("opencti_token")
+        if not opencti_url or not token_secret_id:
+            raise IntegrationNotReady("waiting for opencti-platform integration")
+        token = self.model.get_secret(id=token_secret_id).get_content(refresh=True)["token"]
+        workers, surplus_workers = self._plan_numbered_services(
+            plan, "worker", self._get_worker_count()
+        )
+        # stop surplus workers first, replan would restart them after disabling them
+        self._stop_services(*surplus_workers)
+        self._push_if_changed(
+            _CHARM_WORKER_CHECK_SCRIPT_PATH, _CHARM_WORKER_CHECK_SCRIPT, encoding="utf-8"
+        )
+        self._add_layer_if_changed(
+            ops.pebble.LayerDict(
+                summary="OpenCTI worker",
+                description="OpenCTI worker",
+                services=self._gen_worker_services(
+                    workers, surplus_workers, opencti_url, token, requires_platform=False
+                ),
+                checks=self._gen_worker_checks(workers, surplus_workers),
+            ),
+            plan,
+        )
+        self._start_services(*workers, wait=False)
+
+    def _reconcile_worker_integrations(self) -> None:
+        """Share the OpenCTI URL and a token with the worker-only applications."""
+        if not self.unit.is_leader():
+            return
+        for integration in self.model.relations["opencti-worker"]:
+            integration.data[self.app]["opencti_url"] = typing.cast(str, self._ingress.url)
+            self._set_integration_token(
+                integration, self._get_peer_secret(_PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD)
+            )
+
+    def _get_role(self) -> str:
+        """Get the role of the unit from the role configuration.
+
+        Returns:
+            all, platform or worker.
+
+        Raises:
+            InvalidConfig: invalid role configuration.
+        """
+        role = str(self.config.get("role", "all"))
+        if role not in ("all", "platform", "worker"):
+            raise InvalidConfig("invalid charm config: role")
+        return role
+
+    def _plan_numbered_services(
+        self, plan: ops.pebble.Plan, prefix: str, count: int
+    ) -> tuple[list[str], list[str]]:
+        """Get the numbered services to run and the surplus numbered services.
+
+        Args:
+            plan: the current Pebble plan.
+            prefix: prefix of the service names, for example worker for worker-0, worker-1...
+            count: number of services.
+
+        Returns:
+            names of the services and names of the surplus services in the plan.
+        """
+        services = [f"{prefix}-{i}" for i in range(count)]
+        surplus_services = sorted(
+            name
+            for name in plan.services
+            if re.fullmatch(rf"{prefix}-\d+", name) and name not in services
+        )
+        return services, surplus_services
+
+    def _get_split_managers(self) -> bool:
+        """Check if the OpenCTI background managers run in their own process.
+
+        Returns:
+            True if the background managers run in a process separated from the API.
+        """
+        return bool(self.config.get("platform-split-managers", False))
+
+    def _get_assigned_managers(self) -> list[str]:
+        """Get the OpenCTI background managers assigned to this unit.
+
+        The managers are spread round-robin over the units in the peer integration, sorted by
+        unit number, so every unit computes the same placement and the managers of a departed
+        unit are reassigned to the remaining units.
+
+        Returns:
+            The enable flags of the background managers running on this unit.
+        """
+        units = [self.unit]
+        if peer_integration := self.model.get_relation(_PEER_INTEGRATION_NAME):
+            units.extend(peer_integration.units)
+        units.sort(key=lambda unit: int(unit.name.split("/")[-1]))
+        index = units.index(self.unit)
+        return [
+            flag
+            for position, flag in enumerate(_OPENCTI_MANAGER_FLAGS)
+            if position % len(units) == index
+        ]
+
+    def _get_platform_processes(self) -> int:
+        """Get the number of OpenCTI platform processes from the charm configuration.
+
+        Returns:
+            The number of OpenCTI platform processes.
+
+        Raises:
+            InvalidConfig: platform-processes is not a positive integer.
+        """
+        processes = typing.cast(int, self.config.get("platform-processes", 1))
+        if processes < 1:
+            raise InvalidConfig("invalid charm config: platform-processes")
+        return processes
+
+    def _get_worker_count(self) -> int:
+        """Get the number of OpenCTI workers.
+
+        Returns:
+            The number of OpenCTI workers, within the autoscaling range if enabled.
+        """
+        minimum, maximum = self._get_worker_count_range()
+        autoscaled = typing.cast(int, self._stored.autoscaled_worker_count)
+        return max(minimum, min(maximum, autoscaled))
+
+    def _get_worker_count_range(self) -> tuple[int, int]:
+        """Get the range of the number of OpenCTI workers from the charm configuration.
+
+        Returns:
+            The minimum and maximum number of OpenCTI workers, both are the same if worker
+            autoscaling is disabled.
+
+        Raises:
+            InvalidConfig: worker-count is neither a positive integer nor auto, or the
+                worker autoscaling configuration is invalid.
+        """
+        worker_count = str(self.config.get("worker-count", "3")).strip().lower()
+        if worker_count == "auto":
+            minimum = self._get_cpu_limit()
+        else:
+            try:
+                minimum = int(worker_count)
+            except ValueError as exc:
+                raise InvalidConfig("invalid charm config: worker-count") from exc
+            if minimum < 1:
+                raise InvalidConfig("invalid charm config: worker-count")
+        maximum = typing.cast(int, self.config.get("worker-autoscale-max", 0))
+        if maximum < 0:
+            raise InvalidConfig("invalid charm config: worker-autoscale-max")
+        if typing.cast(int, self.config.get("worker-autoscale-messages-per-worker", 1000)) < 1:
+            raise InvalidConfig("invalid charm config: worker-autoscale-messages-per-worker")
+        return minimum, max(minimum, maximum)
+
+    def _on_update_status(self, event: ops.UpdateStatusEvent) -> None:
+        """Handle update-status event.
+
+        Args:
+            event: Update status event.
+        """
+        self._autoscale_workers()
+        self._publish_connector_backpressure()
+        self._reconcile(event)
+
+    def _autoscale_workers(self) -> None:
+        """Update the number of OpenCTI workers based on the RabbitMQ queue backlog.
+
+        The reconciliation applies the new number of workers.
+        """
+        # the worker count range reads the container CPU limit through pebble
+        if not self._container.can_connect():
+            return
+        try:
+            minimum, maximum = self._get_worker_count_range()
+        except InvalidConfig:
+            return
+        if minimum == maximum:
+            return
+        backlog = self._queue_backlog
+        if backlog is None:
+            return
+        current = self._get_worker_count()
+        target = autoscaler.compute_worker_count(
+            current=current,
+            backlog=backlog,
+            minimum=minimum,
+            maximum=maximum,
+            messages_per_worker=typing.cast(
+                int, self.config.get("worker-autoscale-messages-per-worker", 1000)
+            ),
+        )
+        if target != current:
+            logger.info(
+                "scale opencti workers from %s to %s, %s message(s) queued",
+                current,
+                target,
+                backlog,
+            )
+        self._stored.autoscaled_worker_count = target
+
+    @functools.cached_property
+    def _queue_backlog(self) -> int | None:
+        """The number of messages waiting in the OpenCTI push queues, fetched once per hook.
+
+        Returns:
+            The queue backlog, None if it can't be fetched from the RabbitMQ management API.
+        """
+        integration = self.model.get_relation("amqp")
+        if integration is None or not integration.units or not self._container.can_connect():
+            return None
+        try:
+            env = self._gen_rabbitmq_env()
+            return autoscaler.get_queue_backlog(
+                f"http://{env['RABBITMQ__HOSTNAME']}:{env['RABBITMQ__PORT_MANAGEMENT']}",
+                username=env["RABBITMQ__USERNAME"],
+                password=env["RABBITMQ__PASSWORD"],
+            )
+        except (IntegrationNotReady, requests.exceptions.RequestException) as exc:
+            logger.warning("failed to get rabbitmq queue backlog: %s", exc)
+            return None
+
+    def _publish_connector_backpressure(self) -> None:
+        """Publish the backpressure level derived from the queue backlog to the connectors.
+
+        The connector charms slow down their ingestion while the workers are saturated.
+        """
+        integrations = self.model.relations["opencti-connector"]
+        if not self.unit.is_leader() or not integrations:
+            return
+        backlog = self._queue_backlog
+        if backlog is None:
+            return
+        try:
+            _, workers = self._get_worker_count_range()
+        except InvalidConfig:
+            return
+        current = typing.cast(str, self._stored.connector_backpressure)
+        level = autoscaler.compute_backpressure(
+            current=current,
+            backlog=backlog,
+            workers=workers,
+            messages_per_worker=typing.cast(
+                int, self.config.get("worker-autoscale-messages-per-worker", 1000)
+            ),
+        )
+        if level != current:
+            logger.info(
+                "connector backpressure changed from %s to %s, %s message(s) queued",
+                current,
+                level,
+                backlog,
+            )
+        self._stored.connector_backpressure = level
+        for integration in integrations:
+            if integration.data[self.app].get("backpressure") != level:
+                integration.data[self.app]["backpressure"] = level
+
+    def _get_cpu_limit(self) -> int:
+        """Get the number of CPUs available to the OpenCTI container.
+
+        Returns:
+            The CPU quota of the container cgroup rounded up, or the number of CPUs if the
+            container has no CPU quota.
+        """
+        try:
+            with self._container.pull(_CGROUP_CPU_MAX_PATH, encoding="ascii") as file:
+                quota, period = file.read().split()
+        except (ops.pebble.PathError, ValueError):
+            quota, period = "max", ""
+        if quota == "max":
+            return os.cpu_count() or 1
+        return max(1, math.ceil(int(quota) / int(period)))
+
+    def _get_memory_limit(self) -> int | None:
+        """Get the memory limit of the OpenCTI container.
+
+        Returns:
+            The memory limit of the container cgroup in bytes, None if there's no limit.
+        """
+        try:
+            with self._container.pull(_CGROUP_MEMORY_MAX_PATH, encoding="ascii") as file:
+                limit = file.read().strip()
+        except ops.pebble.PathError:
+            return None
+        return None if limit == "max" else int(limit)
+
+    @functools.cached_property
+    def _platform_heap(self) -> tuple[int, int | None]:
+        """The heap size of each OpenCTI platform process and the memory limit of the container.
+
+        Returns:
+            The heap size in MiB and the container memory limit in MiB, None if the container
+            has no memory limit.
+
+        Raises:
+            InvalidConfig: platform-heap-ratio is not between 0 and 1.
+        """
+        ratio = typing.cast(float, self.config.get("platform-heap-ratio", 0.5))
+        if not 0 < ratio <= 1:
+            raise InvalidConfig("invalid charm config: platform-heap-ratio")
+        limit = self._get_memory_limit()
+        if limit is None:
+            heap = _DEFAULT_PLATFORM_HEAP_MIB // self._get_platform_processes()
+            return max(_MIN_PLATFORM_HEAP_MIB, heap), None
+        limit_mib = limit // 2**20
+        heap = int(limit_mib * ratio) // self._get_platform_processes()
+        return max(_MIN_PLATFORM_HEAP_MIB, heap), limit_mib
+
+    @functools.cached_property
+    def _platform_managers_heap(self) -> int:
+        """The heap size of the OpenCTI background managers process.
+
+        Returns:
+            The heap size in MiB.
+
+        Raises:
+            InvalidConfig: platform-managers-heap-ratio is not between 0 and 1.
+        """
+        ratio = typing.cast(float, self.config.get("platform-managers-heap-ratio", 0.25))
+        if not 0 < ratio <= 1:
+            raise InvalidConfig("invalid charm config: platform-managers-heap-ratio")
+        limit = self._get_memory_limit()
+        if limit is None:
+            return max(_MIN_PLATFORM_HEAP_MIB, int(_DEFAULT_PLATFORM_HEAP_MIB * ratio))
+        return max(_MIN_PLATFORM_HEAP_MIB, int(limit // 2**20 * ratio))
+
+    def _gen_node_options(self, heap: int) -> str:
+        """Generate the Node.js options of an OpenCTI platform process from its heap size.
+
+        Args:
+            heap: heap size of the process in MiB.
+
+        Returns:
+            The NODE_OPTIONS environment variable.
+        """
+        if self._platform_heap[1] is None:
+            return f"--max-old-space-size={heap}"
+        # larger young generations mean fewer scavenges for the allocation-heavy API
+        semi_space = 64 if heap >= 4096 else 32 if heap >= 2048 else 16
+        options = [f"--max-old-space-size={heap}", f"--max-semi-space-size={semi_space}"]
+        if heap < 1024:
+            options.append("--optimize-for-size")
+        return " ".join(options)
+
+    def _get_platform_heap_status(self) -> str:
+        """Get the unit status message reporting the OpenCTI platform heap size.
+
+        Returns:
+            The status message, empty if the container has no memory limit.
+        """
+        heap, limit = self._platform_heap
+        if limit is None:
+            return ""
+        processes = self._get_platform_processes()
+        heaps = f"{processes}x{heap}MiB" if processes > 1 else f"{heap}MiB"
+        if self._get_split_managers():
+            heaps = f"{heaps} + managers {self._platform_managers_heap}MiB"
+        return f"platform heap {heaps} of {limit}MiB"
+
+    def _stop_services(self, *names: str) -> None:
+        """Stop the Pebble services that are running.
 
-        self._container.stop("charm-callback")
-        self._container.add_layer(
-            label="opencti",
-            layer=self._gen_pebble_check_plan(health_check_url),
-            combine=True,
+        Args:
+            names: names of the Pebble services.
+        """
+        if not names:
+            return
+        running = [s.name for s in self._container.get_services(*names).values() if s.is_running()]
+        if running:
+            self._container.stop(*running)
+
+    def _add_layer_if_changed(self, layer: ops.pebble.LayerDict, plan: ops.pebble.Plan) -> bool:
+        """Add a layer to the Pebble plan and replan, unless the plan already contains it.
+
+        Args:
+            layer: the Pebble layer.
+            plan: the current Pebble plan.
+
+        Returns:
+            True if the Pebble plan has changed.
+        """
+        unchanged = all(
+            name in plan.services
+            and plan.services[name].to_dict() == ops.pebble.Service(name, service).to_dict()
+            for name, service in layer.get("services", {}).items()
+        ) and all(
+            name in plan.checks
+            and plan.checks[name].to_dict() == ops.pebble.Check(name, check).to_dict()
+            for name, check in layer.get("checks", {}).items()
         )
+        if unchanged:
+            return False
+        self._container.add_layer("opencti", layer=layer, combine=True)
         self._container.replan()
-        self._container.start("worker-0")
-        self._container.start("worker-1")
-        self._container.start("worker-2")
+        return True
+
+    def _start_services(self, *names: str, wait: bool = True) -> None:
+        """Start the Pebble services that are not running, in a single Pebble change.
 
-    def _gen_pebble_service_plan(self) -> ops.pebble.LayerDict:
+        Args:
+            names: names of the Pebble services.
+            wait: wait for the services to start, otherwise return as soon as the Pebble change
+                is submitted and leave the start-up to Pebble.
+        """
+        stopped = [
+            s.name for s in self._container.get_services(*names).values() if not s.is_running()
+        ]
+        if not stopped:
+            return
+        if wait:
+            self._container.start(*stopped)
+        else:
+            self._container.pebble.start_services(stopped, timeout=0)
+
+    def _push_if_changed(self, path: pathlib.Path, content: str, encoding: str) -> bool:
+        """Push a file to the container, unless the file already has the same content.
+
+        Args:
+            path: path of the file in the container.
+            content: content of the file.
+            encoding: encoding of the file.
+
+        Returns:
+            True if the file has been pushed.
+        """
+        try:
+            with self._container.pull(path, encoding=encoding) as file:
+                if file.read() == content:
+                    return False
+        except ops.pebble.PathError:
+            pass
+        self._container.push(path, content, encoding=encoding, make_dirs=True)
+        return True
+
+    def _gen_pebble_service_plan(
+        self,
+        plan: ops.pebble.Plan,
+        platforms: tuple[list[str], list[str]],
+        workers: tuple[list[str], list[str]],
+    ) -> ops.pebble.LayerDict:
         """Generate the service part of OpenCTI pebble plan.
 
+        With multiple platform processes, the platform service is a balancer in front of the
+        platform-<n> services, each listening on its own port.
+
+        Args:
+            plan: the current Pebble plan.
+            platforms: names of the platform process services and names of the platform
+                process services to disable, services can't be removed from the pebble plan.
+            workers: names of the worker services and names of the worker services to disable.
+
         Returns:
             The service part of OpenCTI pebble plan
         """
+        platform_processes, surplus_platform_processes = platforms
+        split_managers = self._get_split_managers()
+        services: dict[str, ops.pebble.ServiceDict] = {}
+        # the startup callback of previous charm revisions can't be removed from the pebble plan
+        if "charm-callback" in plan.services:
+            services["charm-callback"] = {
+                "override": "replace",
+                "summary": "OpenCTI platform startup callback, disabled",
+                "command": "true",
+                "startup": "disabled",
+            }
+        if not platform_processes:
+            services["platform"] = self._gen_platform_service(
+                _PLATFORM_PORT, _PLATFORM_METRICS_PORT, managers=not split_managers
+            )
+        else:
+            services["platform"] = {
+                "override": "replace",
+                "summary": "OpenCTI platform balancer",
+                "command": f"node {_CHARM_BALANCER_SCRIPT_PATH}",
+                "environment": {
+                    "LISTEN_PORT": str(_PLATFORM_PORT),
+                    "BACKEND_PORTS": ",".join(
+                        str(_PLATFORM_PORT + 1 + i) for i in range(len(platform_processes))
+                    ),
+                },
+                "after": platform_processes,
+                "requires": platform_processes,
+            }
+            for index, name in enumerate(platform_processes):
+                # the managers assigned to this unit must only run once
+                services[name] = self._gen_platform_service(
+                    _PLATFORM_PORT + 1 + index,
+                    _PLATFORM_METRICS_PORT + 1 + index,
+                    managers=not split_managers and index == 0,
+                )
+        if split_managers:
+            services["platform-managers"] = {
+                **self._gen_platform_service(
+                    _PLATFORM_MANAGERS_PORT,
+                    _PLATFORM_MANAGERS_METRICS_PORT,
+                    managers=True,
+                    heap=self._platform_managers_heap,
+                ),
+                "summary": "OpenCTI platform background managers",
+                "after": ["platform"],
+            }
+        elif "platform-managers" in plan.services:
+            services["platform-managers"] = {
+                "override": "replace",
+                "summary": "OpenCTI platform background managers, disabled",
+                "command": "node build/back.js",
+                "startup": "disabled",
+            }
+        for name in surplus_platform_processes:
+            services[name] = {
+                "override": "replace",
+                "summary": "surplus OpenCTI platform process, disabled",
+                "command": "node build/back.js",
+                "startup": "disabled",
+            }
+        services.update(
+            self._gen_worker_services(
+                *workers,
+                self._base_url,
+                self._get_peer_secret(_PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD),
+                requires_platform=True,
+            )
+        )
+        return ops.pebble.LayerDict(
+            summary="OpenCTI platform/worker",
+            description="OpenCTI platform/worker",
+            services=services,
+        )
+
+    def _gen_platform_service(
+        self, port: int, metrics_port: int, managers: bool, heap: int | None = None
+    ) -> ops.pebble.ServiceDict:
+        """Generate an OpenCTI platform process service.
+
+        Args:
+            port: port of the OpenCTI API.
+            metrics_port: port of the OpenCTI Prometheus metrics.
+            managers: whether the background managers assigned to this unit run in this
+                process.
+            heap: heap size of the process in MiB, defaults to the API process heap size.
+
+        Returns:
+            The OpenCTI platform process service.
+        """
+        env = {
+            "NODE_OPTIONS": self._gen_node_options(heap or self._platform_heap[0]),
+            "NODE_ENV": "production",
+            "PYTHONUNBUFFERED": "1",
+            "APP__PORT": str(port),
+            "APP__APP_LOGS__LOGS_LEVEL": "info",
+            "PROVIDERS__LOCAL__STRATEGY": "LocalStrategy",
+            "APP__TELEMETRY__METRICS__ENABLED": "true",
+            **self._gen_secret_env(),
+            **self._gen_opensearch_env(),
+            **self._gen_rabbitmq_env(),
+            **self._gen_redis_env(),
+            **self._gen_s3_env(),
+            **self._gen_ingress_env(),
+        }
+        if metrics_port != _PLATFORM_METRICS_PORT:
+            env["APP__TELEMETRY__METRICS__EXPORTER_PROMETHEUS"] = str(metrics_port)
+        assigned_managers = self._get_assigned_managers() if managers else []
+        env.update(
+            {flag: "false" for flag in _OPENCTI_MANAGER_FLAGS if flag not in assigned_managers}
+        )
+        return {
+            "override": "replace",
+            "command": "node build/back.js",
+            "working-dir": "/opt/opencti",
+            "environment": env,
+        }
+
+    @staticmethod
+    def _gen_worker_services(  # pylint: disable=too-many-arguments
+        workers: list[str],
+        surplus_workers: list[str],
+        opencti_url: str,
+        opencti_token: str,
+        *,
+        requires_platform: bool,
+    ) -> dict[str, ops.pebble.ServiceDict]:
+        """Generate the OpenCTI worker services of the pebble plan.
+
+        Args:
+            workers: names of the worker services.
+            surplus_workers: names of the worker services to disable, services can't be
+                removed from the pebble plan.
+            opencti_url: URL of the OpenCTI platform.
+            opencti_token: OpenCTI API token of the workers.
+            requires_platform: whether the OpenCTI platform runs in the same container.
+
+        Returns:
+            The worker services of the pebble plan.
+        """
         worker_service: ops.pebble.ServiceDict = {
             "override": "replace",
             "command": "python3 worker.py",
             "working-dir": "/opt/opencti-worker",
             "environment": {
-                "OPENCTI_URL": self._base_url,
-                "OPENCTI_TOKEN": self._get_peer_secret(_PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD),
+                "OPENCTI_URL": opencti_url,
+                "OPENCTI_TOKEN": opencti_token,
                 "WORKER_LOG_LEVEL": "info",
             },
-            "after": ["platform"],
-            "requires": ["platform"],
         }
-        return ops.pebble.LayerDict(
-            summary="OpenCTI platform/worker",
-            description="OpenCTI platform/worker",
-            services={
-                "charm-callback": {
-                    "override": "replace",
-                    "command": f"bash {_CHARM_CALLBACK_SCRIPT_PATH}",
-                },
-                "platform": {
+        if requires_platform:
+            worker_service["after"] = ["platform"]
+            worker_service["requires"] = ["platform"]
+        return {
+            **{name: worker_service for name in workers},
+            **{
+                name: {
                     "override": "replace",
-                    "command": "node build/back.js",
-                    "working-dir": "/opt/opencti",
-                    "environment": {
-                        "NODE_OPTIONS": "--max-old-space-size=8096",
-                        "NODE_ENV": "production",
-                        "PYTHONUNBUFFERED": "1",
-                        "APP__PORT": "8080",
-                        "APP__APP_LOGS__LOGS_LEVEL": "info",
-                        "PROVIDERS__LOCAL__STRATEGY": "LocalStrategy",
-                        "APP__TELEMETRY__METRICS__ENABLED": "true",
-                        **self._gen_secret_env(),
-                        **self._gen_opensearch_env(),
-                        **self._gen_rabbitmq_env(),
-                        **self._gen_redis_env(),
-                        **self._gen_s3_env(),
-                        **self._gen_ingress_env(),
-                    },
-                },
-                "worker-0": worker_service,
-                "worker-1": worker_service,
-                "worker-2": worker_service,
+                    "summary": "surplus OpenCTI worker, disabled",
+                    "command": "python3 worker.py",
+                    "startup": "disabled",
+                }
+                for name in surplus_workers
             },
-        )
+        }
+
+    @staticmethod
+    def _gen_worker_checks(
+        workers: list[str], surplus_workers: list[str]
+    ) -> dict[str, ops.pebble.CheckDict]:
+        """Generate the liveness checks of the OpenCTI workers, named after the worker services.
 
-    def _gen_pebble_check_plan(self, health_check_url: str) -> ops.pebble.LayerDict:
+        Args:
+            workers: names of the worker services.
+            surplus_workers: names of the disabled worker services, checks can't be removed
+                from the pebble plan.
+
+        Returns:
+            The worker checks of the pebble plan.
+        """
+        checks: dict[str, ops.pebble.CheckDict] = {
+            name: {
+                "override": "replace",
+                "level": "alive",
+                "startup": "enabled",
+                "exec": {
+                    "command": f"python3 {_CHARM_WORKER_CHECK_SCRIPT_PATH}",
+                    "service-context": name,
+                },
+                "period": f"{_WORKER_CHECK_PERIOD}s",
+                "timeout": f"{_WORKER_CHECK_TIMEOUT}s",
+                "threshold": _WORKER_CHECK_THRESHOLD,
+            }
+            for name in workers
+        }
+        for name in surplus_workers:
+            checks[name] = {"override": "replace", "exec": {"command": "true"}, "period": "1h"}
+        return checks
+
+    def _gen_pebble_check_plan(
+        self,
+        plan: ops.pebble.Plan,
+        health_check_url: str,
+        platforms: tuple[list[str], list[str]],
+        workers: tuple[list[str], list[str]],
+    ) -> ops.pebble.LayerDict:
         """Generate the check part of OpenCTI pebble plan.
 
         Args:
+            plan: the current Pebble plan.
             health_check_url: OpenCTI health check URL
+            platforms: names of the platform process services and names of the surplus
+                platform process services.
+            workers: names of the worker services and names of the surplus worker services.
 
         Returns:
             The check part of OpenCTI pebble plan
         """
+        platform_processes, surplus_platform_processes = platforms
+        check: ops.pebble.CheckDict = {
+            "override": "replace",
+            "level": "ready",
+            "startup": "enabled",
+            "http": {"url": health_check_url},
+            "period": f"{_PLATFORM_CHECK_PERIOD}s",
+            "timeout": f"{_PLATFORM_CHECK_TIMEOUT}s",
+            "threshold": _PLATFORM_CHECK_THRESHOLD,
+        }
+        checks = {"platform": check}
+        for index, name in enumerate(platform_processes):
+            process_url = health_check_url.replace(
+                f"localhost:{_PLATFORM_PORT}/", f"localhost:{_PLATFORM_PORT + 1 + index}/", 1
+            )
+            checks[name] = {**check, "http": {"url": process_url}}
+        if self._get_split_managers():
+            checks["platform-managers"] = {
+                **check,
+                "http": {
+                    "url": health_check_url.replace(
+                        f"localhost:{_PLATFORM_PORT}/", f"localhost:{_PLATFORM_MANAGERS_PORT}/", 1
+                    )
+                },
+            }
+        elif "platform-managers" in plan.checks:
+            surplus_platform_processes = [*surplus_platform_processes, "platform-managers"]
+        # checks can't be removed from the pebble plan either
+        for name in surplus_platform_processes:
+            checks[name] = {"override": "replace", "exec": {"command": "true"}, "period": "1h"}
+        checks.update(self._gen_worker_checks(*workers))
         return ops.pebble.LayerDict(
             summary="OpenCTI platform/worker",
             description="OpenCTI platform/worker",
-            checks={
-                "platform": {
-                    "override": "replace",
-                    "level": "ready",
-                    "http": {"url": health_check_url},
-                    "period": "1m",
-                    "timeout": "5s",
-                    "threshold": 5,
-                }
-            },
+            checks=checks,
         )
 
-    def _install_callback_script(self, health_check_url: str) -> None:
-        """Install platform startup callback script for noticing the charm on start.
-
-        Args:
-            health_check_url: opencti health check endpoint.
-        """
-        script = textwrap.dedent(f"""\
-            while :; do
-                if curl -m 3 -sfo /dev/null "{health_check_url}"; then
-                    pebble notify canonical.com/opencti/platform-healthy
-                    pebble stop charm-callback
-                    break
-                else
-                    sleep 5
-                fi
-            done
-            """)
-        self._container.make_dir(_CHARM_CALLBACK_SCRIPT_PATH.parent, make_parents=True)
-        self._container.push(_CHARM_CALLBACK_SCRIPT_PATH, script, encoding="utf-8")
-
-    @staticmethod
-    def _is_platform_healthy(health_check_url: str) -> bool:  # pragma: nocover
-        """Check OpenCTI platform is ready using the health check url.
-
-        Args:
-            health_check_url: OpenCTI platform health check endpoint.
+    def _is_platform_ready(self) -> bool:
+        """Check if the OpenCTI platform is ready using the status of the platform Pebble check.
 
         Returns:
-            True if platform is healthy, False otherwise.
+            True if the platform check is up and has succeeded at least once since it was
+            started.
         """
-        try:
-            response = requests.get(health_check_url, timeout=5)
-            response.raise_for_status()
-            return True
-        except requests.exceptions.RequestException:
+        check = self._container.get_checks("platform").get("platform")
+        if check is None or check.status != ops.pebble.CheckStatus.UP:
             return False
+        if check.successes is not None:
+            return check.successes > 0
+        # Pebble before 1.23 doesn't report the successes and reports a started check as up
+        # until it has failed threshold times, a check still up after that has succeeded
+        window = _PLATFORM_CHECK_THRESHOLD * _PLATFORM_CHECK_PERIOD + _PLATFORM_CHECK_TIMEOUT
+        started = typing.cast(float, self._stored.platform_check_started)
+        return time.time() - started >= window
 
     def _check_preconditions(self) -> None:
         """Check the prerequisites for the OpenCTI charm."""
@@ -583,12 +1443,7 @@ class OpenCTICharm(ops.CharmBase):
         """
         data = self._extract_opensearch_info()
         if ca := data.get("tls-ca"):
-            self._container.make_dir("/opt/opencti/config/", make_parents=True)
-            self._container.push(
-                "/opt/opencti/config/opensearch.pem",
-                source=ca,
-                encoding="ascii",
-            )
+            self._push_if_changed(_OPENSEARCH_CERT_PATH, ca, encoding="ascii")
 
     def _gen_redis_env(self) -> dict[str, str]:
         """Generate the Redis-related environment variables for the OpenCTI platform.
@@ -710,54 +1565,215 @@ class OpenCTICharm(ops.CharmBase):
         return json.dumps(dump)
 
     def _reconcile_connector(self) -> None:
-        """Run charm reconcile function for OpenCTI connectors."""
+        """Run charm reconcile function for OpenCTI connectors.
+
+        The desired connector users are compared with the existing ones first, then all
+        changes are applied in batches so the number of requests doesn't depend on the number
+        of opencti-connector integrations. The resulting connector users are cached in the
+        charm state, no request is sent while the cache is valid and matches the desired
+        connector users.
+        """
         if not self.unit.is_leader():
+            # the cache is only maintained by the leader
+            self._invalidate_connector_user_cache()
             return
-        client = opencti.OpenctiClient(
-            url=self._base_url,
-            api_token=self._get_peer_secret(_PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD),
+        self._stored.connector_reconcile_count = (
+            typing.cast(int, self._stored.connector_reconcile_count) + 1
         )
-        integrations = self.model.relations["opencti-connector"]
-        active_connector_users = set()
-        for integration in integrations:
-            if integration.app is None:
-                continue
-            user = self._setup_connector_integration_and_user(client, integration)
-            if user:
-                active_connector_users.add(user)
-        for opencti_user in client.list_users(name_starts_with=_OPENCTI_CONNECTOR_USER_PREFIX):
-            if opencti_user.name not in active_connector_users:
-                client.set_account_status(opencti_user.id, "Inactive")
-
-    def _setup_connector_integration_and_user(
-        self, client: opencti.OpenctiClient, integration: ops.Relation
-    ) -> str | None:
-        """Set up the connector integration and connector user.
+        integrations_hash = self._connector_integrations_hash()
+        if (
+            integrations_hash == self._stored.connector_integrations_hash
+            and time.time() < typing.cast(float, self._stored.connector_users_expiry)
+        ):
+            self._stored.connector_fast_path_count = (
+                typing.cast(int, self._stored.connector_fast_path_count) + 1
+            )
+            logger.info(
+                "opencti-connector integrations unchanged, skip connector reconciliation "
+                "(fast path taken %s/%s times)",
+                self._stored.connector_fast_path_count,
+                self._stored.connector_reconcile_count,
+            )
+            return
+        connector_integrations = self._get_connector_integrations()
+        desired_users = {user: group for _, user, group in connector_integrations}
+        if self._connector_user_cache_hit(connector_integrations):
+            logger.debug("connector users unchanged, skip opencti api requests")
+            self._stored.connector_integrations_hash = integrations_hash
+            return
+        users = asyncio.run(self._reconcile_connector_users(desired_users))
+        for integration, user, _ in connector_integrations:
+            self._set_integration_token(integration, users[user].api_token)
+        self._stored.connector_users = {
+            u.name: {
+                "id": u.id,
+                "account_status": u.account_status,
+                "token_sha256": hashlib.sha256(u.api_token.encode()).hexdigest(),
+            }
+            for u in users.values()
+        }
+        self._stored.connector_users_expiry = time.time() + _CONNECTOR_USER_CACHE_TTL
+        # tokens shared in this reconciliation change the secret revisions
+        self._stored.connector_integrations_hash = self._connector_integrations_hash()
+
+    def _invalidate_connector_user_cache(self) -> None:
+        """Invalidate the cached connector users."""
+        self._stored.connector_users = {}
+        self._stored.connector_users_expiry = 0.0
+        self._stored.connector_integrations_hash = ""
+
+    def _connector_integrations_hash(self) -> str:
+        """Hash everything the connector reconciliation depends on, except the OpenCTI users.
+
+        That is the OpenCTI URL and, for each opencti-connector integration, the integration
+        ID, the connector name and type and the revision of the connector token secret.
+
+        Returns:
+            hex digest of the opencti-connector integrations.
+        """
+        content: list = [self._ingress.url]
+        for integration in sorted(self.model.relations["opencti-connector"], key=lambda r: r.id):
+            remote_data = integration.data[integration.app] if integration.app else {}
+            token_secret_id = integration.data[self.app].get("opencti_token")
+            token_revision = (
+                self.model.get_secret(id=token_secret_id).get_info().revision
+                if token_secret_id
+                else None
+            )
+            content.append(
+                [
+                    integration.id,
+                    remote_data.get("connector_charm_name"),
+                    remote_data.get("connector_type"),
+                    token_secret_id,
+                    token_revision,
+                ]
+            )
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def _connector_user_cache_hit(
+        self, connector_integrations: list[tuple[ops.Relation, str, str]]
+    ) -> bool:
+        """Check if the cached connector users are valid and match the desired state.
 
         Args:
-            client: the OpenCTI client.
-            integration: the opencti-connector integration object.
+            connector_integrations: list of (integration, connector user name, group name).
 
         Returns:
-            name of the opencti user created for this integration, None if no user is needed.
+            True if the cache is valid and no connector user needs to be updated.
         """
-        integration_data = integration.data[integration.app]
-        connector_charm_name = integration_data.get("connector_charm_name")
-        connector_type = integration_data.get("connector_type")
-        if not connector_charm_name or not connector_type:
-            return None
-        opencti_url = self._ingress.url
-        integration.data[self.app]["opencti_url"] = opencti_url
-        connector_user_name = f"charm-connector-{connector_charm_name.replace('_', '-').lower()}"
-        connector_user = self._get_opencti_user(client, connector_user_name)
-        if connector_user is None:
-            connector_user = self._create_opencti_user(
-                client, connector_user_name, self._get_connector_group(connector_type)
+        if time.time() >= typing.cast(float, self._stored.connector_users_expiry):
+            return False
+        cache = typing.cast(dict[str, dict[str, str]], self._stored.connector_users)
+        desired_users = {user for _, user, _ in connector_integrations}
+        for name, cached_user in cache.items():
+            if (cached_user["account_status"] == "Inactive") == (name in desired_users):
+                return False
+        for integration, user, _ in connector_integrations:
+            if user not in cache:
+                return False
+            token_secret_id = integration.data[self.app].get("opencti_token")
+            if not token_secret_id:
+                return False
+            token = self.model.get_secret(id=token_secret_id).get_content(refresh=True)["token"]
+            if hashlib.sha256(token.encode()).hexdigest() != cache[user]["token_sha256"]:
+                return False
+        return True
+
+    async def _reconcile_connector_users(
+        self, desired_users: dict[str, str]
+    ) -> dict[str, opencti.OpenctiUser]:
+        """Create, activate and deactivate the connector users.
+
+        Independent requests are sent concurrently, so the time spent depends on the slowest
+        request rather than on the total number of requests.
+
+        Args:
+            desired_users: mapping from the desired connector user names to their group name.
+
+        Returns:
+            mapping from connector user names to connector users.
+
+        Raises:
+            PlatformNotReady: a group doesn't exist in the OpenCTI platform yet.
+        """
+        async with opencti.AsyncOpenctiClient(
+            url=self._base_url,
+            api_token=self._get_peer_secret(_PEER_SECRET_ADMIN_TOKEN_SECRET_FIELD),
+        ) as client:
+            users = {
+                u.name: u
+                for u in await client.list_users(name_starts_with=_OPENCTI_CONNECTOR_USER_PREFIX)
+            }
+            # the groups are only needed to create the missing users
+            missing_user_groups = {
+                name: group for name, group in desired_users.items() if name not in users
+            }
+            group_names = sorted(set(missing_user_groups.values()))
+            groups = await asyncio.gather(*(client.get_group(name) for name in group_names))
+            group_ids = {
+                name: group.id for name, group in zip(group_names, groups) if group is not None
+            }
+            missing_users = {}
+            for name, group_name in missing_user_groups.items():
+                if group_name not in group_ids:
+                    raise PlatformNotReady(f"waiting for opencti group {group_name}")
+                missing_users[name] = [group_ids[group_name]]
+            statuses: dict[str, typing.Literal["Active", "Inactive"]] = {}
+            for name, user in users.items():
+                if name in desired_users and user.account_status == "Inactive":
+                    statuses[user.id] = "Active"
+                if name not in desired_users and user.account_status != "Inactive":
+                    statuses[user.id] = "Inactive"
+            # new users are created active, so both batches are independent
+            new_users, _ = await asyncio.gather(
+                client.create_users(missing_users), client.set_account_statuses(statuses)
+            )
+            users = {
+                name: user._replace(account_status=statuses.get(user.id, user.account_status))
+                for name, user in users.items()
+            }
+            users.update({u.name: u for u in new_users})
+            logger.info(
+                "sent %s opencti api request(s) over %s connection(s)",
+                client.requests_sent,
+                client.connections_opened,
+            )
+        return users
+
+    def _get_connector_integrations(self) -> list[tuple[ops.Relation, str, str]]:
+        """Get the opencti-connector integrations that require a connector user.
+
+        Also publish the OpenCTI URL to these integrations.
+
+        Returns:
+            list of (integration, connector user name, connector user group name).
+        """
+        result = []
+        for integration in self.model.relations["opencti-connector"]:
+            if integration.app is None:
+                continue
+            integration_data = integration.data[integration.app]
+            connector_charm_name = integration_data.get("connector_charm_name")
+            connector_type = integration_data.get("connector_type")
+            if not connector_charm_name or not connector_type:
+                continue
+            integration.data[self.app]["opencti_url"] = typing.cast(str, self._ingress.url)
+            connector_user_name = (
+                f"{_OPENCTI_CONNECTOR_USER_PREFIX}{connector_charm_name.replace('_', '-').lower()}"
             )
-        if connector_user.account_status == "Inactive":
-            client.set_account_status(connector_user.id, "Active")
+            result.append(
+                (integration, connector_user_name, self._get_connector_group(connector_type))
+            )
+        return result
+
+    def _set_integration_token(self, integration: ops.Relation, api_token: str) -> None:
+        """Share an OpenCTI API token with an opencti-connector or opencti-worker integration.
 
-        api_token = connector_user.api_token
+        Args:
+            integration: the integration object.
+            api_token: the OpenCTI API token.
+        """
         opencti_token_id = integration.data[self.app].get("opencti_token")
         if not opencti_token_id:
             secret = self.app.add_secret(content={"token": api_token})
@@ -767,7 +1783,6 @@ class OpenCTICharm(ops.CharmBase):
             secret = self.model.get_secret(id=opencti_token_id)
             if secret.get_content(refresh=True)["token"] != api_token:
                 secret.set_content({"token": api_token})
-        return connector_user_name
 
     def _get_connector_group(self, connector_type: str) -> str:
         """Get the connector group for the given connector type.
@@ -784,40 +1799,6 @@ class OpenCTICharm(ops.CharmBase):
             else "Connectors"
         )
 
-    def _create_opencti_user(
-        self, client: opencti.OpenctiClient, name: str, group_name: str
-    ) -> opencti.OpenctiUser:
-        """Create a new OpenCTI user.
-
-        Args:
-            client: the OpenCTI client.
-            name: the name of the user.
-            group_name: the name of the group.
-
-        Returns:
-            The new OpenCTI user.
-        """
-        groups = {g.name: g for g in client.list_groups()}
-        group_id = groups[group_name].id
-        return client.create_user(name=name, groups=[group_id])
-
-    def _get_opencti_user(
-        self, client: opencti.OpenctiClient, name: str
-    ) -> opencti.OpenctiUser | None:
-        """Get the OpenCTI user by name.
-
-        Args:
-            client: the OpenCTI client.
-            name: the name of the user.
-
-        Returns:
-            The OpenCTI user.
-        """
-        users = users = {
-            u.name: u for u in client.list_users(name_starts_with=_OPENCTI_CONNECTOR_USER_PREFIX)
-        }
-        return users.get(name)
-
 
 if __name__ == "__main__":  # pragma: nocover
     ops.main(OpenCTICharm)
@@ -3,19 +3,42 @@
 
 """OpenCTI API client."""
 
+# pylint: disable=too-many-lines
+
+import asyncio
+import copy
 import functools
+import hashlib
+import json
 import logging
 import pathlib
 import secrets
+import time
 import typing
 import urllib.parse
 
 import gql
-import gql.dsl
+import gql.client
+import gql.transport.exceptions
+import gql.transport.httpx
 import gql.transport.requests
 import graphql
+import httpx
+import requests.adapters
 
 gql.transport.requests.log.setLevel(logging.WARNING)
+gql.transport.httpx.log.setLevel(logging.WARNING)
+
+_DEFAULT_PAGE_SIZE = 100
+_RETRY_STATUS_CODES = (502, 503, 504)
+_RETRY_BACKOFF_FACTOR = 0.5
+_DEFAULT_MAX_CONCURRENCY = 8
+
+# generated from opencti.graphql by scripts/gen_opencti_schema.py
+_SCHEMA_SDL_PATH = pathlib.Path(__file__).parent / "opencti.pruned.graphql"
+_SCHEMA_INTROSPECTION_PATH = pathlib.Path(__file__).parent / "opencti.pruned.graphql.json"
+
+logger = logging.getLogger(__name__)
 
 
 class OpenctiUser(typing.NamedTuple):
@@ -52,28 +75,546 @@ class GraphqlError(Exception):
     """GraphQL error."""
 
 
-class OpenctiClient:
-    """Opencti API client."""
+# static GraphQL operations used by the OpenctiClient, all inputs are passed as variables
+OPERATIONS: dict[str, graphql.DocumentNode] = {
+    name: graphql.parse(source, no_location=True)
+    for name, source in {
+        "ListUsers": """
+            query ListUsers($first: Int, $after: ID, $filters: FilterGroup) {
+              users(first: $first, after: $after, filters: $filters) {
+                edges { node { id name user_email account_status api_token } }
+                pageInfo { endCursor hasNextPage }
+              }
+            }
+        """,
+        "CreateUser": """
+            mutation CreateUser($input: UserAddInput!) {
+              userAdd(input: $input) { id name user_email account_status api_token }
+            }
+        """,
+        "ListGroups": """
+            query ListGroups($first: Int, $after: ID, $filters: FilterGroup) {
+              groups(first: $first, after: $after, filters: $filters) {
+                edges { node { id name } }
+                pageInfo { endCursor hasNextPage }
+              }
+            }
+        """,
+        "SetAccountStatus": """
+            mutation SetAccountStatus($id: ID!, $input: [EditInput]!) {
+              userEdit(id: $id) { fieldPatch(input: $input) { id } }
+            }
+        """,
+    }.items()
+}
+
+
+def dump_schema() -> None:
+    """Serialize the OpenCTI GraphQL schema as introspection JSON.
+
+    This is executed at charm build time, building a schema from introspection JSON is
+    an order of magnitude faster than parsing the SDL file.
+    """
+    sdl = _SCHEMA_SDL_PATH.read_text(encoding="utf-8")
+    schema = graphql.build_schema(sdl, assume_valid_sdl=True)
+    _SCHEMA_INTROSPECTION_PATH.write_text(
+        json.dumps(
+            {
+                "sdl_sha256": hashlib.sha256(sdl.encode("utf-8")).hexdigest(),
+                "introspection": graphql.introspection_from_schema(schema),
+            }
+        ),
+        encoding="utf-8",
+    )
+
+
+@functools.cache
+def load_schema() -> graphql.GraphQLSchema:
+    """Load the OpenCTI GraphQL schema.
+
+    The schema is built once per process and shared by all OpenctiClient instances.
+    The serialized schema created by dump_schema is used if it matches the SDL file,
+    otherwise the SDL file is parsed.
+
+    Returns:
+        The OpenCTI GraphQL schema.
+    """
+    sdl = _SCHEMA_SDL_PATH.read_text(encoding="utf-8")
+    try:
+        serialized = json.loads(_SCHEMA_INTROSPECTION_PATH.read_text(encoding="utf-8"))
+        if serialized["sdl_sha256"] == hashlib.sha256(sdl.encode("utf-8")).hexdigest():
+            return graphql.build_client_schema(serialized["introspection"])
+        logger.warning("serialized opencti schema is outdated, parsing the SDL file")
+    except FileNotFoundError:
+        logger.warning("serialized opencti schema doesn't exist, parsing the SDL file")
+    # json.JSONDecodeError is a ValueError, build_client_schema raises TypeError
+    except (ValueError, KeyError, TypeError):
+        logger.exception("serialized opencti schema is invalid, parsing the SDL file")
+    return graphql.build_schema(sdl, assume_valid_sdl=True)
+
+
+@functools.cache
+def validate_operations() -> None:
+    """Validate all static GraphQL operations against the OpenCTI GraphQL schema.
+
+    The validation only runs once per process.
+
+    Raises:
+        GraphqlError: if any operation is invalid.
+    """
+    schema = load_schema()
+    for name, document in OPERATIONS.items():
+        if errors := graphql.validate(schema, document):
+            raise GraphqlError(f"invalid operation {name}: {'; '.join(map(str, errors))}")
+
+
+class _RenameVariables(graphql.Visitor):
+    """Add a suffix to all variable names in a GraphQL document."""
+
+    def __init__(self, suffix: str) -> None:
+        """Construct the visitor.
+
+        Args:
+            suffix: variable name suffix.
+        """
+        super().__init__()
+        self._suffix = suffix
+
+    def leave_variable(self, node: graphql.VariableNode, *_: typing.Any) -> graphql.VariableNode:
+        """Rename a variable.
+
+        Args:
+            node: variable node.
+
+        Returns:
+            renamed variable node.
+        """
+        return graphql.VariableNode(name=graphql.NameNode(value=node.name.value + self._suffix))
+
+
+@functools.lru_cache(maxsize=32)
+def batch_operation(operation: str, size: int) -> graphql.DocumentNode:
+    """Combine multiple copies of a single-field operation into one aliased GraphQL document.
+
+    The field of the n-th copy is aliased as op<n> and its variables are suffixed with _<n>.
+    The result is valid as long as the static operation is valid.
+
+    Args:
+        operation: name of the operation in OPERATIONS.
+        size: number of copies.
+
+    Returns:
+        the combined GraphQL document.
+    """
+    definition = typing.cast(graphql.OperationDefinitionNode, OPERATIONS[operation].definitions[0])
+    variables = []
+    selections = []
+    for index in range(size):
+        renamed = graphql.visit(definition, _RenameVariables(f"_{index}"))
+        variables.extend(renamed.variable_definitions)
+        field = copy.copy(renamed.selection_set.selections[0])
+        field.alias = graphql.NameNode(value=f"op{index}")
+        selections.append(field)
+    return graphql.DocumentNode(
+        definitions=(
+            graphql.OperationDefinitionNode(
+                operation=definition.operation,
+                name=graphql.NameNode(value=f"{operation}Batch"),
+                variable_definitions=tuple(variables),
+                directives=(),
+                selection_set=graphql.SelectionSetNode(selections=tuple(selections)),
+            ),
+        )
+    )
+
 
-    def __init__(self, url: str, api_token: str) -> None:
+class _OpenctiClientBase:  # pylint: disable=too-few-public-methods
+    """Common parts of the synchronous and asynchronous Opencti API clients.
+
+    Attributes:
+        requests_sent: number of GraphQL requests sent by the client.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        api_token: str,
+        validate: bool = True,
+        *,
+        page_size: int = _DEFAULT_PAGE_SIZE,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        retries: int = 3,
+    ) -> None:
         """Construct the Opencti client.
 
         Args:
             url: URL of the Opencti API.
             api_token: Opencti API token.
+            validate: validate the static GraphQL operations against the schema before the
+                first query, set to False to trust the operations and skip loading the schema.
+            page_size: number of items fetched per request when listing users and groups.
+            connect_timeout: timeout in seconds for establishing a connection.
+            read_timeout: timeout in seconds for reading a response.
+            retries: number of retries on connection errors and, for queries, 502/503/504
+                responses, with exponential backoff.
         """
         url = url + "/" if len(url) > 0 and url[-1] != "/" else url
+        self._url = urllib.parse.urljoin(url, "graphql")
+        self._api_token = api_token
+        self._validate = validate
+        self._page_size = page_size
+        self._timeout = (connect_timeout, read_timeout)
+        self._retries = retries
+        self.requests_sent = 0
+
+    def _request(
+        self, operation: str, variables: dict[str, typing.Any] | None = None
+    ) -> gql.GraphQLRequest:
+        """Create the request of a static GraphQL operation.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of the operation.
+
+        Returns:
+            the GraphQL request.
+        """
+        if self._validate:
+            validate_operations()
+        return gql.GraphQLRequest(
+            OPERATIONS[operation], variable_values=variables, operation_name=operation
+        )
+
+    def _retry_delay(
+        self,
+        request: gql.GraphQLRequest,
+        exc: gql.transport.exceptions.TransportServerError,
+        attempt: int,
+    ) -> float | None:
+        """Get the delay before retrying a failed GraphQL request.
+
+        Mutations aren't retried, the server may have applied them before the error, for
+        example when a gateway times out waiting for the response.
+
+        Args:
+            request: the GraphQL request.
+            exc: the error of the request.
+            attempt: number of retries of the request so far.
+
+        Returns:
+            the delay in seconds, None if the request must not be retried.
+        """
+        if exc.code not in _RETRY_STATUS_CODES or attempt >= self._retries:
+            return None
+        if any(
+            definition.operation != graphql.OperationType.QUERY
+            for definition in request.document.definitions
+            if isinstance(definition, graphql.OperationDefinitionNode)
+        ):
+            return None
+        return _RETRY_BACKOFF_FACTOR * 2**attempt
+
+    def _batch_request(
+        self, operation: str, variables: typing.Sequence[dict[str, typing.Any]]
+    ) -> gql.GraphQLRequest:
+        """Create the request of multiple copies of a static GraphQL operation.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of each copy of the operation.
+
+        Returns:
+            the GraphQL request, the result of copy n is aliased as op<n>.
+        """
+        if self._validate:
+            validate_operations()
+        return gql.GraphQLRequest(
+            batch_operation(operation, len(variables)),
+            variable_values={
+                f"{name}_{index}": value
+                for index, copy_variables in enumerate(variables)
+                for name, value in copy_variables.items()
+            },
+            operation_name=f"{operation}Batch",
+        )
+
+    def _page_variables(self, after: str | None, filters: dict | None) -> dict:
+        """Create the variables of a list operation.
+
+        Args:
+            after: cursor of the previous page, None for the first page.
+            filters: filters passed to the list operation.
+
+        Returns:
+            the list operation variables.
+        """
+        return {"first": self._page_size, "after": after, "filters": filters}
+
+    @staticmethod
+    def _parse_user(node: dict) -> OpenctiUser:
+        """Parse a user in the GraphQL result.
+
+        Args:
+            node: user in the GraphQL result.
+
+        Returns:
+            OpenctiUser object.
+        """
+        return OpenctiUser(
+            id=node["id"],
+            name=node["name"],
+            user_email=node["user_email"],
+            account_status=node["account_status"],
+            api_token=node["api_token"],
+        )
+
+    @staticmethod
+    def _name_filter(operator: typing.Literal["eq", "starts_with"], value: str) -> dict:
+        """Create a GraphQL filter group that filters by name.
+
+        Args:
+            operator: filter operator.
+            value: filter value.
+
+        Returns:
+            GraphQL filter group.
+        """
+        return {
+            "mode": "and",
+            "filters": [{"key": "name", "values": [value], "operator": operator, "mode": "and"}],
+            "filterGroups": [],
+        }
+
+    def _user_filters(self, name_starts_with: str | None, name: str | None) -> dict | None:
+        """Create the GraphQL filter group of the users list operation.
+
+        Args:
+            name_starts_with: only list users with name starts with.
+            name: only list users with exactly this name.
+
+        Returns:
+            GraphQL filter group, None to list all users.
+        """
+        if name is not None:
+            return self._name_filter("eq", name)
+        if name_starts_with:
+            return self._name_filter("starts_with", name_starts_with)
+        return None
+
+    @staticmethod
+    def _user_add_input(name: str, user_email: str | None, groups: list[str] | None) -> dict:
+        """Create the input of the userAdd mutation.
+
+        Args:
+            name: User name.
+            user_email: User's email address.
+            groups: User's groups.
+
+        Returns:
+            the userAdd mutation input.
+        """
+        return {
+            "name": name,
+            "user_email": f"{name}@opencti.local" if user_email is None else user_email,
+            "first_name": "",
+            "last_name": "",
+            "password": secrets.token_urlsafe(32),
+            "account_status": "Active",
+            "groups": groups or [],
+        }
+
+    @staticmethod
+    def _account_status_input(user_id: str, status: str) -> dict:
+        """Create the variables of the SetAccountStatus operation.
+
+        Args:
+            user_id: Opencti user id.
+            status: Opencti account status.
+
+        Returns:
+            the SetAccountStatus operation variables.
+        """
+        return {
+            "id": user_id,
+            "input": [{"key": "account_status", "value": [status], "operation": "replace"}],
+        }
+
+
+class OpenctiClient(_OpenctiClientBase):
+    """Opencti API client.
+
+    Attributes:
+        connections_opened: number of HTTP connections opened by the current HTTP session.
+    """
+
+    def __enter__(self) -> "OpenctiClient":
+        """Enter the runtime context.
+
+        Returns:
+            the client itself.
+        """
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        """Exit the runtime context and close the HTTP session."""
+        self.close()
+
+    @functools.cached_property
+    def _session(self) -> gql.client.SyncClientSession:
+        """The gql session, connected on the first query and reused by all later queries.
+
+        The underlying requests session keeps the HTTP connections alive in its pool.
+
+        Returns:
+            The gql session.
+        """
         transport = gql.transport.requests.RequestsHTTPTransport(
-            url=urllib.parse.urljoin(url, "graphql"),
-            headers={"Authorization": f"Bearer {api_token}"},
+            url=self._url,
+            headers={"Authorization": f"Bearer {self._api_token}"},
+            # requests accepts a (connect, read) timeout tuple
+            timeout=typing.cast(int, self._timeout),
         )
-        self._client = gql.Client(
-            transport=transport,
-            schema=(pathlib.Path(__file__).parent / "opencti.graphql").read_text(),
+        # operations are validated once in validate_operations, not on every request
+        session = typing.cast(
+            gql.client.SyncClientSession, gql.Client(transport=transport).connect_sync()
         )
-        self._dsl_schema = gql.dsl.DSLSchema(
-            typing.cast(graphql.GraphQLSchema, self._client.schema)
+        # only retry connection errors, before the request is sent, 502/503/504 are retried
+        # in _send for queries only
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=requests.adapters.Retry(
+                total=None,
+                connect=self._retries,
+                read=0,
+                redirect=0,
+                status=0,
+                other=0,
+                backoff_factor=_RETRY_BACKOFF_FACTOR,
+            )
         )
+        for prefix in "http://", "https://":
+            typing.cast(requests.Session, transport.session).mount(prefix, adapter)
+        return session
+
+    def close(self) -> None:
+        """Close the HTTP session, if any."""
+        if "_session" in self.__dict__:
+            self._session.client.close_sync()
+            del self.__dict__["_session"]
+
+    @property
+    def connections_opened(self) -> int:
+        """Number of HTTP connections opened by the current HTTP session.
+
+        Returns:
+            number of HTTP connections opened.
+        """
+        if "_session" not in self.__dict__:
+            return 0
+        transport = typing.cast(
+            gql.transport.requests.RequestsHTTPTransport, self._session.client.transport
+        )
+        if transport.session is None:
+            return 0
+        opened = 0
+        # the same adapter can be mounted on multiple prefixes
+        for adapter in {id(a): a for a in transport.session.adapters.values()}.values():
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is not None:
+                opened += sum(pools[key].num_connections for key in pools.keys())
+        return opened
+
+    def _send(self, request: gql.GraphQLRequest) -> dict:
+        """Send a GraphQL request.
+
+        Args:
+            request: the GraphQL request.
+
+        Returns:
+            result data of the request.
+
+        Raises:
+            TransportServerError: if the request failed and can't be retried.
+        """
+        self.requests_sent += 1
+        attempt = 0
+        while True:
+            try:
+                return self._session.execute(request)
+            except gql.transport.exceptions.TransportServerError as exc:
+                delay = self._retry_delay(request, exc, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def _execute(self, operation: str, variables: dict[str, typing.Any] | None = None) -> dict:
+        """Execute a static GraphQL operation.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of the operation.
+
+        Returns:
+            result data of the operation.
+        """
+        return self._send(self._request(operation, variables))
+
+    def _execute_batch(
+        self, operation: str, variables: typing.Sequence[dict[str, typing.Any]]
+    ) -> list[dict]:
+        """Execute multiple copies of a static GraphQL operation in one request.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of each copy of the operation.
+
+        Returns:
+            result of each copy of the operation.
+        """
+        if not variables:
+            return []
+        data = self._send(self._batch_request(operation, variables))
+        return [data[f"op{index}"] for index in range(len(variables))]
+
+    def _paginate(
+        self, operation: str, connection: str, filters: dict | None
+    ) -> typing.Iterator[dict]:
+        """Iterate over the nodes of a paginated connection.
+
+        Args:
+            operation: name of the list operation in OPERATIONS.
+            connection: name of the connection field in the operation result.
+            filters: filters passed to the list operation.
+
+        Yields:
+            nodes in the connection, one page is fetched at a time.
+        """
+        after = None
+        while True:
+            data = self._execute(operation, self._page_variables(after, filters))[connection]
+            for edge in data["edges"] or []:
+                if edge:
+                    yield edge["node"]
+            if not data["pageInfo"]["hasNextPage"]:
+                return
+            after = data["pageInfo"]["endCursor"]
+
+    def iter_users(
+        self, name_starts_with: str | None = None, name: str | None = None
+    ) -> typing.Iterator[OpenctiUser]:
+        """Iterate over OpenCTI users.
+
+        Args:
+            name_starts_with: only iterate over users with name starts with.
+            name: only iterate over users with exactly this name.
+
+        Yields:
+            OpenctiUser objects.
+        """
+        filters = self._user_filters(name_starts_with, name)
+        for node in self._paginate("ListUsers", "users", filters):
+            yield self._parse_user(node)
 
     @functools.lru_cache(maxsize=10)
     def list_users(self, name_starts_with: str | None = None) -> list[OpenctiUser]:
@@ -85,49 +626,18 @@ class OpenctiClient:
         Returns:
             list of OpenctiUser objects.
         """
-        filters = None
-        if name_starts_with:
-            filters = {
-                "mode": "and",
-                "filters": [
-                    {
-                        "key": "name",
-                        "values": name_starts_with,
-                        "operator": "starts_with",
-                        "mode": "and",
-                    }
-                ],
-                "filterGroups": [],
-            }
-        query = gql.dsl.dsl_gql(
-            gql.dsl.DSLQuery(
-                self._dsl_schema.Query.users(filters=filters).select(
-                    self._dsl_schema.UserConnection.edges.select(
-                        self._dsl_schema.UserEdge.node.select(
-                            self._dsl_schema.User.id,
-                            self._dsl_schema.User.name,
-                            self._dsl_schema.User.user_email,
-                            self._dsl_schema.User.account_status,
-                            self._dsl_schema.User.api_token,
-                        ),
-                    ),
-                )
-            )
-        )
-        data = self._client.execute(query)
-        users = []
-        for user in data["users"]["edges"]:
-            node = user["node"]
-            users.append(
-                OpenctiUser(
-                    id=node["id"],
-                    name=node["name"],
-                    user_email=node["user_email"],
-                    account_status=node["account_status"],
-                    api_token=node["api_token"],
-                )
-            )
-        return users
+        return list(self.iter_users(name_starts_with=name_starts_with))
+
+    def get_user(self, name: str) -> OpenctiUser | None:
+        """Get an OpenCTI user by name.
+
+        Args:
+            name: user name.
+
+        Returns:
+            the OpenctiUser object, None if the user doesn't exist.
+        """
+        return next((u for u in self.iter_users(name=name) if u.name == name), None)
 
     def create_user(
         self,
@@ -146,40 +656,42 @@ class OpenctiClient:
             new user.
         """
         self.list_users.cache_clear()
-        if user_email is None:
-            user_email = f"{name}@opencti.local"
-        if groups is None:
-            groups = []
-        query = gql.dsl.dsl_gql(
-            gql.dsl.DSLMutation(
-                self._dsl_schema.Mutation.userAdd.args(
-                    input={
-                        "name": name,
-                        "user_email": user_email,
-                        "first_name": "",
-                        "last_name": "",
-                        "password": secrets.token_urlsafe(32),
-                        "account_status": "Active",
-                        "groups": groups,
-                    }
-                ).select(
-                    self._dsl_schema.User.id,
-                    self._dsl_schema.User.name,
-                    self._dsl_schema.User.user_email,
-                    self._dsl_schema.User.account_status,
-                    self._dsl_schema.User.api_token,
-                )
-            )
+        result = self._execute(
+            "CreateUser", {"input": self._user_add_input(name, user_email, groups)}
         )
-        result = self._client.execute(query)
-        user = result["userAdd"]
-        return OpenctiUser(
-            id=user["id"],
-            name=user["name"],
-            user_email=user["user_email"],
-            account_status=user["account_status"],
-            api_token=user["api_token"],
+        return self._parse_user(result["userAdd"])
+
+    def create_users(self, users: typing.Mapping[str, list[str]]) -> list[OpenctiUser]:
+        """Create multiple OpenCTI users in one request.
+
+        Args:
+            users: mapping from the names of the new users to their groups.
+
+        Returns:
+            new users, in the same order as the input.
+        """
+        self.list_users.cache_clear()
+        results = self._execute_batch(
+            "CreateUser",
+            [
+                {"input": self._user_add_input(name, None, groups)}
+                for name, groups in users.items()
+            ],
         )
+        return [self._parse_user(result) for result in results]
+
+    def iter_groups(self, name: str | None = None) -> typing.Iterator[OpenctiGroup]:
+        """Iterate over OpenCTI groups.
+
+        Args:
+            name: only iterate over groups with exactly this name.
+
+        Yields:
+            OpenctiGroup objects.
+        """
+        filters = None if name is None else self._name_filter("eq", name)
+        for node in self._paginate("ListGroups", "groups", filters):
+            yield OpenctiGroup(id=node["id"], name=node["name"])
 
     @functools.lru_cache(maxsize=10)
     def list_groups(self) -> list[OpenctiGroup]:
@@ -188,23 +700,18 @@ class OpenctiClient:
         Returns:
             list of OpenctiGroup objects.
         """
-        query = gql.dsl.dsl_gql(
-            gql.dsl.DSLQuery(
-                self._dsl_schema.Query.groups.select(
-                    self._dsl_schema.GroupConnection.edges.select(
-                        self._dsl_schema.GroupEdge.node.select(
-                            self._dsl_schema.Group.id, self._dsl_schema.Group.name
-                        )
-                    )
-                )
-            )
-        )
-        data = self._client.execute(query)
-        groups = []
-        for group in data["groups"]["edges"]:
-            group = group["node"]
-            groups.append(OpenctiGroup(id=group["id"], name=group["name"]))
-        return groups
+        return list(self.iter_groups())
+
+    def get_group(self, name: str) -> OpenctiGroup | None:
+        """Get an OpenCTI group by name.
+
+        Args:
+            name: group name.
+
+        Returns:
+            the OpenctiGroup object, None if the group doesn't exist.
+        """
+        return next((g for g in self.iter_groups(name=name) if g.name == name), None)
 
     def set_account_status(
         self,
@@ -218,19 +725,332 @@ class OpenctiClient:
             status: Opencti account status.
         """
         self.list_users.cache_clear()
-        query = gql.dsl.dsl_gql(
-            gql.dsl.DSLMutation(
-                self._dsl_schema.Mutation.userEdit(id=user_id).select(
-                    self._dsl_schema.UserEditMutations.fieldPatch(
-                        input=[
-                            {
-                                "key": "account_status",
-                                "value": status,
-                                "operation": "replace",
-                            }
-                        ]
-                    ).select(self._dsl_schema.User.id)
-                )
-            )
+        self._execute("SetAccountStatus", self._account_status_input(user_id, status))
+
+    def set_account_statuses(
+        self, statuses: typing.Mapping[str, typing.Literal["Active", "Inactive"]]
+    ) -> None:
+        """Set the account status of multiple Opencti users in one request.
+
+        Args:
+            statuses: mapping from Opencti user ids to the new account status.
+        """
+        self.list_users.cache_clear()
+        self._execute_batch(
+            "SetAccountStatus",
+            [self._account_status_input(user_id, status) for user_id, status in statuses.items()],
         )
-        self._client.execute(query)
+
+
+class AsyncOpenctiClient(_OpenctiClientBase):
+    """Asynchronous Opencti API client.
+
+    Queries of the same client can run concurrently, for example with asyncio.gather, up to
+    the maximum concurrency of the client. The client must be used as an async context
+    manager, which connects and closes the HTTP session.
+
+    Attributes:
+        connections_opened: number of HTTP connections opened by the current HTTP session.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        url: str,
+        api_token: str,
+        validate: bool = True,
+        *,
+        max_concurrency: int = _DEFAULT_MAX_CONCURRENCY,
+        page_size: int = _DEFAULT_PAGE_SIZE,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        retries: int = 3,
+    ) -> None:
+        """Construct the asynchronous Opencti client.
+
+        Args:
+            url: URL of the Opencti API.
+            api_token: Opencti API token.
+            validate: validate the static GraphQL operations against the schema before the
+                first query, set to False to trust the operations and skip loading the schema.
+            max_concurrency: maximum number of requests in flight at the same time.
+            page_size: number of items fetched per request when listing users and groups.
+            connect_timeout: timeout in seconds for establishing a connection.
+            read_timeout: timeout in seconds for reading a response.
+            retries: number of retries on connection errors and, for queries, 502/503/504
+                responses, with exponential backoff.
+        """
+        super().__init__(
+            url,
+            api_token,
+            validate,
+            page_size=page_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries=retries,
+        )
+        self._max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: gql.client.AsyncClientSession | None = None
+        self._connections_opened = 0
+
+    async def __aenter__(self) -> "AsyncOpenctiClient":
+        """Enter the runtime context and connect the HTTP session.
+
+        Returns:
+            the client itself.
+        """
+        connect_timeout, read_timeout = self._timeout
+        transport = gql.transport.httpx.HTTPXAsyncTransport(
+            url=self._url,
+            headers={"Authorization": f"Bearer {self._api_token}"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            # httpx ignores the client limits when a custom transport is given
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=self._max_concurrency),
+                # httpx only retries connection errors, 502/503/504 are retried in _send
+                retries=self._retries,
+            ),
+            event_hooks={"request": [self._trace_request]},
+        )
+        self._session = typing.cast(
+            gql.client.AsyncClientSession, await gql.Client(transport=transport).connect_async()
+        )
+        return self
+
+    async def __aexit__(self, *_: typing.Any) -> None:
+        """Exit the runtime context and close the HTTP session."""
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the HTTP session, if any."""
+        if self._session is not None:
+            await self._session.client.close_async()
+            self._session = None
+            self._connections_opened = 0
+
+    @property
+    def connections_opened(self) -> int:
+        """Number of HTTP connections opened by the current HTTP session.
+
+        Returns:
+            number of HTTP connections opened.
+        """
+        return self._connections_opened
+
+    async def _trace_request(self, request: httpx.Request) -> None:
+        """Trace the connection events of an HTTP request.
+
+        Args:
+            request: the HTTP request.
+        """
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, _: dict) -> None:
+        """Count the HTTP connections opened from the connection events.
+
+        Args:
+            event_name: name of the connection event.
+        """
+        if event_name == "connection.connect_tcp.complete":
+            self._connections_opened += 1
+
+    async def _send(self, request: gql.GraphQLRequest) -> dict:
+        """Send a GraphQL request, waiting while too many requests are in flight.
+
+        Args:
+            request: the GraphQL request.
+
+        Returns:
+            result data of the request.
+
+        Raises:
+            RuntimeError: if the client is used outside an async with block.
+            TransportServerError: if the request failed and can't be retried.
+        """
+        if self._session is None:
+            raise RuntimeError("AsyncOpenctiClient must be used in an async with block")
+        self.requests_sent += 1
+        attempt = 0
+        async with self._semaphore:
+            while True:
+                try:
+                    return await self._session.execute(request)
+                except gql.transport.exceptions.TransportServerError as exc:
+                    delay = self._retry_delay(request, exc, attempt)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _execute(
+        self, operation: str, variables: dict[str, typing.Any] | None = None
+    ) -> dict:
+        """Execute a static GraphQL operation.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of the operation.
+
+        Returns:
+            result data of the operation.
+        """
+        return await self._send(self._request(operation, variables))
+
+    async def _execute_batch(
+        self, operation: str, variables: typing.Sequence[dict[str, typing.Any]]
+    ) -> list[dict]:
+        """Execute multiple copies of a static GraphQL operation in one request.
+
+        Args:
+            operation: name of the operation in OPERATIONS.
+            variables: GraphQL variables of each copy of the operation.
+
+        Returns:
+            result of each copy of the operation.
+        """
+        if not variables:
+            return []
+        data = await self._send(self._batch_request(operation, variables))
+        return [data[f"op{index}"] for index in range(len(variables))]
+
+    async def _paginate(self, operation: str, connection: str, filters: dict | None) -> list[dict]:
+        """List the nodes of a paginated connection.
+
+        Args:
+            operation: name of the list operation in OPERATIONS.
+            connection: name of the connection field in the operation result.
+            filters: filters passed to the list operation.
+
+        Returns:
+            nodes in the connection, pages are fetched one after another.
+        """
+        nodes: list[dict] = []
+        after = None
+        while True:
+            result = await self._execute(operation, self._page_variables(after, filters))
+            data = result[connection]
+            nodes.extend(edge["node"] for edge in data["edges"] or [] if edge)
+            if not data["pageInfo"]["hasNextPage"]:
+                return nodes
+            after = data["pageInfo"]["endCursor"]
+
+    async def list_users(
+        self, name_starts_with: str | None = None, name: str | None = None
+    ) -> list[OpenctiUser]:
+        """List OpenCTI users.
+
+        Args:
+            name_starts_with: list users with name starts with.
+            name: list users with exactly this name.
+
+        Returns:
+            list of OpenctiUser objects.
+        """
+        filters = self._user_filters(name_starts_with, name)
+        return [self._parse_user(n) for n in await self._paginate("ListUsers", "users", filters)]
+
+    async def get_user(self, name: str) -> OpenctiUser | None:
+        """Get an OpenCTI user by name.
+
+        Args:
+            name: user name.
+
+        Returns:
+            the OpenctiUser object, None if the user doesn't exist.
+        """
+        return next((u for u in await self.list_users(name=name) if u.name == name), None)
+
+    async def create_user(
+        self,
+        name: str,
+        user_email: str | None = None,
+        groups: list[str] | None = None,
+    ) -> OpenctiUser:
+        """Create a OpenCTI user.
+
+        Args:
+            name: User name.
+            user_email: User's email address.
+            groups: User's groups.
+
+        Returns:
+            new user.
+        """
+        result = await self._execute(
+            "CreateUser", {"input": self._user_add_input(name, user_email, groups)}
+        )
+        return self._parse_user(result["userAdd"])
+
+    async def create_users(self, users: typing.Mapping[str, list[str]]) -> list[OpenctiUser]:
+        """Create multiple OpenCTI users in one request.
+
+        Args:
+            users: mapping from the names of the new users to their groups.
+
+        Returns:
+            new users, in the same order as the input.
+        """
+        results = await self._execute_batch(
+            "CreateUser",
+            [
+                {"input": self._user_add_input(name, None, groups)}
+                for name, groups in users.items()
+            ],
+        )
+        return [self._parse_user(result) for result in results]
+
+    async def list_groups(self, name: str | None = None) -> list[OpenctiGroup]:
+        """List OpenCTI groups.
+
+        Args:
+            name: list groups with exactly this name.
+
+        Returns:
+            list of OpenctiGroup objects.
+        """
+        filters = None if name is None else self._name_filter("eq", name)
+        return [
+            OpenctiGroup(id=node["id"], name=node["name"])
+            for node in await self._paginate("ListGroups", "groups", filters)
+        ]
+
+    async def get_group(self, name: str) -> OpenctiGroup | None:
+        """Get an OpenCTI group by name.
+
+        Args:
+            name: group name.
+
+        Returns:
+            the OpenctiGroup object, None if the group doesn't exist.
+        """
+        return next((g for g in await self.list_groups(name=name) if g.name == name), None)
+
+    async def set_account_status(
+        self,
+        user_id: str,
+        status: typing.Literal["Active", "Inactive"],
+    ) -> None:
+        """Set Opencti account status.
+
+        Args:
+            user_id: Opencti user id.
+            status: Opencti account status.
+        """
+        await self._execute("SetAccountStatus", self._account_status_input(user_id, status))
+
+    async def set_account_statuses(
+        self, statuses: typing.Mapping[str, typing.Literal["Active", "Inactive"]]
+    ) -> None:
+        """Set the account status of multiple Opencti users in one request.
+
+        Args:
+            statuses: mapping from Opencti user ids to the new account status.
+        """
+        await self._execute_batch(
+            "SetAccountStatus",
+            [self._account_status_input(user_id, status) for user_id, status in statuses.items()],
+        )
+
+
+if __name__ == "__main__":  # pragma: nocover
+    dump_schema()
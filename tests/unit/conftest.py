@@ -3,35 +3,34 @@
 
 """Fixtures for charm unit tests."""
 
+import copy
 import typing
 import unittest.mock
-from unittest.mock import MagicMock
 
 import pytest
 
 import opencti
-import src.charm
 from opencti import OpenctiGroup, OpenctiUser
 
 
 @pytest.fixture(scope="function", autouse=True)
 def juju_version(monkeypatch):
     """Patch JUJU_VERSION environment variable."""
-    monkeypatch.setenv("JUJU_VERSION", "3.3.0")
-
-
-@pytest.fixture(scope="function", autouse=True)
-def patch_is_platform_healthy():
-    """Patch OpenCTICharm.is_platform_healthy function."""
-    mock = MagicMock(return_value=True)
-    with unittest.mock.patch.object(src.charm.OpenCTICharm, "_is_platform_healthy", mock):
-        yield mock
+    monkeypatch.setenv("JUJU_VERSION", "3.6.0")
 
 
 @pytest.fixture(scope="function", autouse=True)
 def patch_opencti_client():
-    """Patch OpenctiClient class."""
-    with unittest.mock.patch.object(opencti, "OpenctiClient", OpenctiClientMock):
+    """Patch OpenctiClient and AsyncOpenctiClient classes."""
+    with (
+        unittest.mock.patch.object(opencti, "OpenctiClient", OpenctiClientMock),
+        unittest.mock.patch.object(opencti, "AsyncOpenctiClient", AsyncOpenctiClientMock),
+        unittest.mock.patch.object(
+            OpenctiClientMock,
+            "_users",
+            copy.deepcopy(OpenctiClientMock._users),  # pylint: disable=protected-access
+        ),
+    ):
         yield OpenctiClientMock()
 
 
@@ -40,9 +39,13 @@ class OpenctiClientMock:
 
     Attributes:
         last_instance (OpenctiClientMock): pointer to most-recently created instance
+        requests_sent: number of requests sent.
+        connections_opened: number of connections opened.
     """
 
     last_instance = None
+    requests_sent = 0
+    connections_opened = 0
 
     _users = [
         {
@@ -65,6 +68,17 @@ class OpenctiClientMock:
         self.init_kwargs = _kwargs
         OpenctiClientMock.last_instance = self
 
+    def __enter__(self) -> "OpenctiClientMock":
+        """Enter the runtime context.
+
+        Returns:
+            The client itself.
+        """
+        return self
+
+    def __exit__(self, *_args) -> None:
+        """Exit the runtime context."""
+
     def list_users(self, name_starts_with: str | None = None) -> list[OpenctiUser]:
         """List OpenCTI users.
 
@@ -78,6 +92,17 @@ class OpenctiClientMock:
             OpenctiUser(**u) for u in self._users if u["name"].startswith(name_starts_with or "")
         ]
 
+    def get_user(self, name: str) -> OpenctiUser | None:
+        """Get an OpenCTI user by name.
+
+        Args:
+            name: The name of the user.
+
+        Returns:
+            The OpenctiUser object, None if the user doesn't exist.
+        """
+        return next((OpenctiUser(**u) for u in self._users if u["name"] == name), None)
+
     def list_groups(self) -> list[OpenctiGroup]:
         """List OpenCTI groups.
 
@@ -86,6 +111,17 @@ class OpenctiClientMock:
         """
         return [OpenctiGroup(**g) for g in self._groups]
 
+    def get_group(self, name: str) -> OpenctiGroup | None:
+        """Get an OpenCTI group by name.
+
+        Args:
+            name: The name of the group.
+
+        Returns:
+            The OpenctiGroup object, None if the group doesn't exist.
+        """
+        return next((OpenctiGroup(**g) for g in self._groups if g["name"] == name), None)
+
     def create_user(
         self,
         name: str,
@@ -112,6 +148,20 @@ class OpenctiClientMock:
         self._users.append(new_user)
         return OpenctiUser(**new_user)
 
+    def create_users(self, users: dict[str, list[str]]) -> list[OpenctiUser]:
+        """Create multiple users.
+
+        Args:
+            users: mapping from user names to user groups.
+
+        Returns:
+            The created users.
+        """
+        return [
+            typing.cast(OpenctiUser, self.create_user(name, groups=groups))
+            for name, groups in users.items()
+        ]
+
     def set_account_status(
         self,
         user_id: str,
@@ -131,3 +181,71 @@ class OpenctiClientMock:
                 user["account_status"] = status
                 return
         raise RuntimeError(f"Unknown user id: {user_id}")
+
+    def set_account_statuses(
+        self, statuses: dict[str, typing.Literal["Active", "Inactive"]]
+    ) -> None:
+        """Set the account status of multiple users.
+
+        Args:
+            statuses: mapping from user IDs to account status.
+        """
+        for user_id, status in statuses.items():
+            self.set_account_status(user_id, status)
+
+
+class AsyncOpenctiClientMock:
+    """A mock for AsyncOpenctiClient, backed by OpenctiClientMock.
+
+    Attributes:
+        requests_sent: number of requests sent.
+        connections_opened: number of connections opened.
+    """
+
+    requests_sent = 0
+    connections_opened = 0
+
+    def __init__(self, *args, **kwargs):
+        """Initialize AsyncOpenctiClientMock.
+
+        Args:
+            args: positional arguments of the client.
+            kwargs: keyword arguments of the client.
+        """
+        self._client = OpenctiClientMock(*args, **kwargs)
+
+    async def __aenter__(self) -> "AsyncOpenctiClientMock":
+        """Enter the runtime context.
+
+        Returns:
+            The client itself.
+        """
+        return self
+
+    async def __aexit__(self, *_args) -> None:
+        """Exit the runtime context."""
+
+    def __getattr__(self, name: str) -> typing.Callable[..., typing.Awaitable]:
+        """Get the coroutine version of an OpenctiClientMock method.
+
+        Args:
+            name: method name.
+
+        Returns:
+            coroutine function calling the OpenctiClientMock method.
+        """
+        method = getattr(self._client, name)
+
+        async def _method(*args, **kwargs):
+            """Call the OpenctiClientMock method.
+
+            Args:
+                args: positional arguments of the method.
+                kwargs: keyword arguments of the method.
+
+            Returns:
+                the result of the method.
+            """
+            return method(*args, **kwargs)
+
+        return _method
@@ -11,18 +11,21 @@ import ops.testing
 class StateBuilder:
     """ops.testing.State builder."""
 
-    def __init__(self, leader=True, can_connect=True):
+    def __init__(self, leader=True, can_connect=True, platform_check_successes=1):
         """Initialize the state builder.
 
         Args:
             leader: whether this charm has leadership.
             can_connect: whether the pebble is ready.
+            platform_check_successes: successes of the platform Pebble check, the Pebble mock
+                doesn't run the checks, None like Pebble before 1.23.
         """
         self._integrations = []
         self._config = {}
         self._secrets = []
         self._leader = leader
         self._can_connect = can_connect
+        self._platform_check_successes = platform_check_successes
 
     def add_opensearch_client_integration(self, insecure=False) -> "StateBuilder":
         """Add opensearch-client integration.
@@ -266,6 +269,28 @@ class StateBuilder:
                 ops.testing.Container(  # type: ignore
                     name="opencti",
                     can_connect=self._can_connect,
+                    layers={
+                        "opencti": ops.pebble.Layer(
+                            {
+                                "checks": {
+                                    "platform": {
+                                        "override": "replace",
+                                        "level": "ready",
+                                        "startup": "enabled",
+                                        "threshold": 3,
+                                        "http": {"url": "http://localhost:8080/opencti/health"},
+                                    }
+                                }
+                            }
+                        )
+                    },
+                    check_infos={
+                        ops.testing.CheckInfo(
+                            "platform",
+                            level=ops.pebble.CheckLevel.READY,
+                            successes=self._platform_check_successes,
+                        )
+                    },
                 )
             ],
             relations=self._integrations,
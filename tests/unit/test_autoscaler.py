@@ -0,0 +1,85 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the OpenCTI worker autoscaler."""
+
+import unittest.mock
+
+import pytest
+
+import autoscaler
+
+
+@pytest.mark.parametrize(
+    "current, backlog, expected",
+    [
+        pytest.param(3, 0, 2, id="idle-scale-down-one"),
+        pytest.param(2, 0, 2, id="idle-minimum"),
+        pytest.param(3, 3000, 3, id="steady"),
+        pytest.param(3, 1500, 3, id="hysteresis"),
+        pytest.param(3, 999, 2, id="scale-down"),
+        pytest.param(3, 3001, 4, id="scale-up"),
+        pytest.param(3, 7000, 7, id="scale-up-many"),
+        pytest.param(3, 100000, 8, id="maximum"),
+    ],
+)
+def test_compute_worker_count(current, backlog, expected):
+    """
+    arrange: none.
+    act: compute the number of workers for a queue backlog.
+    assert: workers are added for the backlog and removed one at a time within the range.
+    """
+    assert (
+        autoscaler.compute_worker_count(
+            current=current, backlog=backlog, minimum=2, maximum=8, messages_per_worker=1000
+        )
+        == expected
+    )
+
+
+def test_get_queue_backlog():
+    """
+    arrange: mock the RabbitMQ management API response.
+    act: get the backlog of the push queues.
+    assert: only the messages in the push queues are counted.
+    """
+    response = unittest.mock.MagicMock()
+    response.json.return_value = [
+        {"name": "push_connector-a", "messages": 10},
+        {"name": "push_connector-b", "messages": None},
+        {"name": "push_connector-c", "messages": 5},
+        {"name": "listen_connector-a", "messages": 100},
+    ]
+    with unittest.mock.patch("requests.get", return_value=response) as get:
+        backlog = autoscaler.get_queue_backlog("http://rabbitmq:15672", "user", "password")
+
+    assert backlog == 15
+    assert get.call_args.args[0] == "http://rabbitmq:15672/api/queues"
+    assert get.call_args.kwargs["auth"] == ("user", "password")
+
+
+@pytest.mark.parametrize(
+    "current, backlog, expected",
+    [
+        pytest.param("none", 0, "none", id="idle"),
+        pytest.param("none", 7999, "none", id="below-elevated"),
+        pytest.param("none", 8000, "elevated", id="elevated"),
+        pytest.param("none", 40000, "high", id="high"),
+        pytest.param("high", 20000, "high", id="hysteresis"),
+        pytest.param("high", 15999, "elevated", id="relieve-one-level"),
+        pytest.param("elevated", 0, "none", id="relieve"),
+        pytest.param("unknown", 0, "none", id="unknown-level"),
+    ],
+)
+def test_compute_backpressure(current, backlog, expected):
+    """
+    arrange: none.
+    act: compute the connector backpressure level for a queue backlog with 4 workers.
+    assert: backpressure is raised with the backlog and relieved one level at a time.
+    """
+    assert (
+        autoscaler.compute_backpressure(
+            current=current, backlog=backlog, workers=4, messages_per_worker=1000
+        )
+        == expected
+    )
@@ -5,17 +5,23 @@
 
 """Unit tests."""
 
+# pylint: disable=too-many-lines
+
+import dataclasses
 import json
+import time
 import typing
+import unittest.mock
 
 import ops.testing
 import pytest
+import scenario.mocking
 
+from src.charm import _OPENCTI_MANAGER_FLAGS as OPENCTI_MANAGER_FLAGS
 from src.charm import OpenCTICharm
 from tests.unit.state import StateBuilder
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_pebble_plan():
     """
     arrange: provide the charm with the required integrations and configurations.
@@ -35,16 +41,28 @@ def test_pebble_plan():
                 },
                 "level": "ready",
                 "override": "replace",
-                "period": "1m",
-                "threshold": 5,
-                "timeout": "5s",
-            }
+                "period": "3s",
+                "startup": "enabled",
+                "threshold": 2,
+                "timeout": "2s",
+            },
+            **{
+                f"worker-{i}": {
+                    "exec": {
+                        "command": "python3 /opt/opencti-worker/charm-worker-check.py",
+                        "service-context": f"worker-{i}",
+                    },
+                    "level": "alive",
+                    "override": "replace",
+                    "period": "60s",
+                    "startup": "enabled",
+                    "threshold": 3,
+                    "timeout": "15s",
+                }
+                for i in range(3)
+            },
         },
         "services": {
-            "charm-callback": {
-                "command": "bash /opt/opencti/charm-callback.sh",
-                "override": "replace",
-            },
             "platform": {
                 "command": "node build/back.js",
                 "environment": {
@@ -130,12 +148,655 @@ def test_pebble_plan():
         },
     }
     assert (container.get_filesystem(ctx) / "opt/opencti/config/opensearch.pem").exists()
+    assert (container.get_filesystem(ctx) / "opt/opencti-worker/charm-worker-check.py").exists()
+
+
+def test_worker_start_non_blocking():
+    """
+    arrange: provide the charm with the required integrations and configurations.
+    act: simulate a config-changed event.
+    assert: the workers are started in a single Pebble change without waiting for it, after
+        the platform.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    pebble_client = scenario.mocking._MockPebbleClient  # pylint: disable=protected-access
+
+    with unittest.mock.patch.object(
+        pebble_client, "start_services", autospec=True, side_effect=pebble_client.start_services
+    ) as start_services:
+        state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    start_services.assert_called_with(
+        unittest.mock.ANY, ["worker-0", "worker-1", "worker-2"], timeout=0
+    )
+    container = state_out.get_container("opencti")
+    assert container.service_statuses["worker-0"] == ops.pebble.ServiceStatus.ACTIVE
+
+
+@pytest.mark.parametrize(
+    "worker_count, cpu_max, expected_workers",
+    [
+        pytest.param("5", None, 5, id="fixed"),
+        pytest.param("auto", "250000 100000", 3, id="auto-cpu-limit"),
+        pytest.param("auto", None, 7, id="auto-no-cpu-limit"),
+    ],
+)
+def test_worker_count(tmp_path, monkeypatch, worker_count, cpu_max, expected_workers):
+    """
+    arrange: provide the charm with the worker-count configuration and a container CPU limit.
+    act: simulate a config-changed event.
+    assert: the expected number of worker services is planned and started.
+    """
+    monkeypatch.setattr("os.cpu_count", lambda: 7)
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("worker-count", worker_count)
+        .build()
+    )
+    if cpu_max is not None:
+        (tmp_path / "cpu.max").write_text(cpu_max, encoding="ascii")
+        container = dataclasses.replace(
+            state_in.get_container("opencti"),
+            mounts={"cgroup": ops.testing.Mount(location="/sys/fs/cgroup", source=tmp_path)},
+        )
+        state_in = dataclasses.replace(state_in, containers=[container])
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    container = state_out.get_container("opencti")
+    workers = [name for name in container.plan.services if name.startswith("worker-")]
+    assert sorted(workers) == sorted(f"worker-{i}" for i in range(expected_workers))
+    assert all(container.service_statuses[w] == ops.pebble.ServiceStatus.ACTIVE for w in workers)
+
+
+@pytest.mark.parametrize(
+    "memory_max, heap_ratio, expected_node_options, expected_message",
+    [
+        pytest.param("max", 0.5, "--max-old-space-size=8096", "", id="no-limit"),
+        pytest.param(
+            str(4 * 2**30),
+            0.5,
+            "--max-old-space-size=2048 --max-semi-space-size=32",
+            "platform heap 2048MiB of 4096MiB",
+            id="limit",
+        ),
+        pytest.param(
+            str(2 * 2**30),
+            0.25,
+            "--max-old-space-size=512 --max-semi-space-size=16 --optimize-for-size",
+            "platform heap 512MiB of 2048MiB",
+            id="small-limit",
+        ),
+    ],
+)
+def test_platform_heap(tmp_path, memory_max, heap_ratio, expected_node_options, expected_message):
+    """
+    arrange: provide the charm with a container memory limit and a platform heap ratio.
+    act: simulate a config-changed event.
+    assert: the platform heap is sized from the memory limit and reported in the status.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("platform-heap-ratio", heap_ratio)  # type: ignore[arg-type]
+        .build()
+    )
+    (tmp_path / "memory.max").write_text(memory_max, encoding="ascii")
+    container = dataclasses.replace(
+        state_in.get_container("opencti"),
+        mounts={"cgroup": ops.testing.Mount(location="/sys/fs/cgroup", source=tmp_path)},
+    )
+    state_in = dataclasses.replace(state_in, containers=[container])
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    platform = state_out.get_container("opencti").plan.services["platform"]
+    assert platform.environment["NODE_OPTIONS"] == expected_node_options
+    assert state_out.unit_status == ops.ActiveStatus(expected_message)
+
+
+def test_platform_heap_no_limit():
+    """
+    arrange: provide the charm with multiple platform processes and no container memory limit.
+    act: simulate a config-changed event.
+    assert: the default platform heap is shared between the platform processes and the
+        managers process gets its share of the default heap.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("platform-processes", 2)  # type: ignore[arg-type]
+        .set_config("platform-split-managers", True)  # type: ignore[arg-type]
+        .build()
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    services = state_out.get_container("opencti").plan.services
+    for name in ("platform-0", "platform-1"):
+        assert services[name].environment["NODE_OPTIONS"] == "--max-old-space-size=4048"
+    assert services["platform-managers"].environment["NODE_OPTIONS"] == (
+        "--max-old-space-size=2024"
+    )
+
+
+def test_platform_processes():
+    """
+    arrange: provide the charm with the platform-processes configuration.
+    act: simulate a config-changed event, then decrease platform-processes.
+    assert: the platform processes listen on their own ports behind the balancer, only the
+        first one runs the background managers, surplus platform processes are disabled.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("platform-processes", 2)  # type: ignore[arg-type]
+        .build()
+    )
+
+    state = ctx.run(ctx.on.config_changed(), state_in)
+
+    container = state.get_container("opencti")
+    services = container.plan.services
+    assert services["platform"].command == "node /opt/opencti/charm-balancer.js"
+    assert services["platform"].environment == {
+        "LISTEN_PORT": "8080",
+        "BACKEND_PORTS": "8081,8082",
+    }
+    assert services["platform"].requires == ["platform-0", "platform-1"]
+    for index, name in enumerate(["platform-0", "platform-1"]):
+        assert services[name].environment["APP__PORT"] == str(8081 + index)
+        assert services[name].environment["APP__TELEMETRY__METRICS__EXPORTER_PROMETHEUS"] == str(
+            14270 + index
+        )
+        assert container.plan.checks[name].http == {
+            "url": f"http://localhost:{8081 + index}/opencti/health"
+            "?health_access_key=opencti-health-access-key"
+        }
+    assert not any(f in services["platform-0"].environment for f in OPENCTI_MANAGER_FLAGS)
+    assert all(services["platform-1"].environment[f] == "false" for f in OPENCTI_MANAGER_FLAGS)
+    assert (container.get_filesystem(ctx) / "opt/opencti/charm-balancer.js").exists()
+
+    state_out = ctx.run(
+        ctx.on.config_changed(),
+        dataclasses.replace(state, config={**state.config, "platform-processes": 1}),
+    )
+
+    container = state_out.get_container("opencti")
+    assert container.plan.services["platform"].command == "node build/back.js"
+    assert container.plan.services["platform"].environment["APP__PORT"] == "8080"
+    for name in ("platform-0", "platform-1"):
+        assert container.plan.services[name].startup == "disabled"
+        assert container.service_statuses[name] == ops.pebble.ServiceStatus.INACTIVE
+        assert container.plan.checks[name].exec == {"command": "true"}
+
+
+def test_platform_split_managers():
+    """
+    arrange: provide the charm with the platform-split-managers configuration.
+    act: simulate a config-changed event, then disable platform-split-managers.
+    assert: the background managers run in their own process and are disabled in the API
+        process, the managers process is stopped and disabled afterwards.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("platform-split-managers", True)  # type: ignore[arg-type]
+        .build()
+    )
+
+    state = ctx.run(ctx.on.config_changed(), state_in)
+
+    container = state.get_container("opencti")
+    api_env = container.plan.services["platform"].environment
+    managers_env = container.plan.services["platform-managers"].environment
+    assert api_env["RULE_ENGINE__ENABLED"] == "false"
+    assert api_env["HISTORY_MANAGER__ENABLED"] == "false"
+    assert not any(key.endswith("MANAGER__ENABLED") for key in managers_env)
+    assert managers_env["APP__PORT"] == "8079"
+    assert managers_env["APP__TELEMETRY__METRICS__EXPORTER_PROMETHEUS"] == "14268"
+    assert container.service_statuses["platform-managers"] == ops.pebble.ServiceStatus.ACTIVE
+    assert container.plan.checks["platform-managers"].http == {
+        "url": "http://localhost:8079/opencti/health?health_access_key=opencti-health-access-key"
+    }
+
+    state_out = ctx.run(
+        ctx.on.config_changed(),
+        dataclasses.replace(state, config={**state.config, "platform-split-managers": False}),
+    )
+
+    container = state_out.get_container("opencti")
+    assert not any(
+        key.endswith("MANAGER__ENABLED") for key in container.plan.services["platform"].environment
+    )
+    assert container.plan.services["platform-managers"].startup == "disabled"
+    assert container.service_statuses["platform-managers"] == ops.pebble.ServiceStatus.INACTIVE
+    assert container.plan.checks["platform-managers"].exec == {"command": "true"}
+
+
+@pytest.mark.parametrize(
+    "unit_id, peer_unit_ids, expected_managers",
+    [
+        pytest.param(0, [], len(OPENCTI_MANAGER_FLAGS), id="single unit"),
+        pytest.param(0, [1, 2], 6, id="first of three units"),
+        pytest.param(2, [0, 1], 5, id="last of three units"),
+        pytest.param(10, [2], 8, id="unit number order"),
+    ],
+)
+def test_platform_manager_placement(unit_id, peer_unit_ids, expected_managers):
+    """
+    arrange: provide the charm with peer units in the opencti-peer integration.
+    act: simulate a config-changed event.
+    assert: only the background managers assigned to the unit are enabled.
+    """
+    ctx = ops.testing.Context(OpenCTICharm, unit_id=unit_id)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    peer = typing.cast(
+        ops.testing.PeerRelation,
+        next(r for r in state_in.relations if r.endpoint == "opencti-peer"),
+    )
+    state_in = dataclasses.replace(
+        state_in,
+        relations={
+            *(r for r in state_in.relations if r is not peer),
+            dataclasses.replace(peer, peers_data={i: {} for i in peer_unit_ids}),
+        },
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    env = state_out.get_container("opencti").plan.services["platform"].environment
+    disabled = [flag for flag in OPENCTI_MANAGER_FLAGS if env.get(flag) == "false"]
+    assert len(OPENCTI_MANAGER_FLAGS) - len(disabled) == expected_managers
+
+
+def _with_peer_data(
+    state: ops.testing.State, app_data: dict[str, str], peers_data: dict[int, dict[str, str]]
+) -> ops.testing.State:
+    """Set the application data and the peer unit data of the opencti-peer integration.
+
+    Args:
+        state: the state.
+        app_data: local application data of the peer integration.
+        peers_data: data of the peer units.
+
+    Returns:
+        The state with the updated peer integration.
+    """
+    peer = typing.cast(
+        ops.testing.PeerRelation,
+        next(r for r in state.relations if r.endpoint == "opencti-peer"),
+    )
+    peer = dataclasses.replace(
+        peer,
+        local_app_data={**peer.local_app_data, **app_data},
+        peers_data=peers_data,
+    )
+    return dataclasses.replace(
+        state, relations={*(r for r in state.relations if r.endpoint != "opencti-peer"), peer}
+    )
+
+
+def _with_platform_check_started(state: ops.testing.State, started: float) -> ops.testing.State:
+    """Set the time the charm started the platform Pebble check.
+
+    Args:
+        state: the state.
+        started: time the platform check was started, in seconds since the epoch.
+
+    Returns:
+        The state with the updated charm stored state.
+    """
+    stored = next(
+        s for s in state.stored_states if s.owner_path == "OpenCTICharm" and s.name == "_stored"
+    )
+    stored = dataclasses.replace(
+        stored, content={**stored.content, "platform_check_started": started}
+    )
+    return dataclasses.replace(
+        state,
+        stored_states={
+            *(s for s in state.stored_states if s.owner_path != "OpenCTICharm"),
+            stored,
+        },
+    )
+
+
+def _with_platform_check_successes(
+    state: ops.testing.State, successes: int | None
+) -> ops.testing.State:
+    """Set the successes of the platform Pebble check, the Pebble mock doesn't run the checks.
+
+    Args:
+        state: the state.
+        successes: number of successes of the platform check, None like Pebble before 1.23.
+
+    Returns:
+        The state with the updated platform check.
+    """
+    container = state.get_container("opencti")
+    check = dataclasses.replace(container.get_check_info("platform"), successes=successes)
+    container = dataclasses.replace(
+        container,
+        check_infos={*(c for c in container.check_infos if c.name != "platform"), check},
+    )
+    return dataclasses.replace(state, containers={container})
+
+
+@pytest.mark.parametrize(
+    "successes",
+    [
+        pytest.param(0, id="check-not-run"),
+        pytest.param(None, id="successes-not-reported"),
+    ],
+)
+def test_rolling_restart(successes):
+    """
+    arrange: run a non-leader unit with a peer unit, then change the platform configuration.
+    act: simulate a config-changed event without, then with the rolling restart lock, then
+        another config-changed event once the restarted platform check has succeeded.
+    assert: the platform is only restarted once the unit holds the lock, and the unit releases
+        the lock only once the platform check has succeeded after the restart.
+    """
+    ctx = ops.testing.Context(OpenCTICharm, unit_id=1)
+    state_in = (
+        StateBuilder(leader=False)
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("platform-split-managers", True)  # type: ignore[arg-type]
+        .build()
+    )
+    state = ctx.run(ctx.on.config_changed(), _with_peer_data(state_in, {}, {0: {}}))
+    old_env = state.get_container("opencti").plan.services["platform-managers"].environment
+    # only changes the platform-managers service, not the Pebble checks
+    state = dataclasses.replace(
+        state, config={**state.config, "platform-managers-heap-ratio": 0.5}
+    )
+
+    state = ctx.run(ctx.on.config_changed(), state)
+
+    assert state.unit_status == ops.WaitingStatus("waiting for rolling restart")
+    container = state.get_container("opencti")
+    assert container.plan.services["platform-managers"].environment == old_env
+    unit_data = typing.cast(dict, state.get_relations("opencti-peer")[0].local_unit_data)
+    assert unit_data["restart-request"] == "true"
+
+    # the platform check has been up for a while before the restart, the Pebble mock keeps
+    # the successes of the restarted check
+    state = _with_platform_check_successes(state, successes)
+    state = _with_platform_check_started(state, time.time() - 60)
+    state = ctx.run(
+        ctx.on.config_changed(), _with_peer_data(state, {"restart-unit": "opencti/1"}, {0: {}})
+    )
+
+    assert state.unit_status == ops.WaitingStatus("waiting for opencti platform to start")
+    container = state.get_container("opencti")
+    assert container.plan.services["platform-managers"].environment != old_env
+    unit_data = typing.cast(dict, state.get_relations("opencti-peer")[0].local_unit_data)
+    assert unit_data["restart-request"] == "true"
+
+    if successes is None:
+        state = _with_platform_check_started(state, time.time() - 60)
+    else:
+        state = _with_platform_check_successes(state, 1)
+    state_out = ctx.run(ctx.on.config_changed(), state)
+
+    assert state_out.unit_status.name == "active"
+    unit_data = typing.cast(dict, state_out.get_relations("opencti-peer")[0].local_unit_data)
+    assert "restart-request" not in unit_data
+
+
+@pytest.mark.parametrize(
+    "config, changed_config",
+    [
+        pytest.param({"platform-processes": 2}, {"platform-processes": 1}, id="fewer-processes"),
+        pytest.param(
+            {"platform-split-managers": True},
+            {"platform-split-managers": False},
+            id="unsplit-managers",
+        ),
+    ],
+)
+def test_rolling_restart_lock_held(config, changed_config):
+    """
+    arrange: run a non-leader unit with a peer unit holding the rolling restart lock.
+    act: simulate a config-changed event disabling running platform processes.
+    assert: the unit waits for the lock without stopping any platform process.
+    """
+    ctx = ops.testing.Context(OpenCTICharm, unit_id=1)
+    state_builder = StateBuilder(leader=False).add_required_integrations().add_required_configs()
+    for name, value in config.items():
+        state_builder.set_config(name, value)
+    state = ctx.run(ctx.on.config_changed(), _with_peer_data(state_builder.build(), {}, {0: {}}))
+    running = {
+        name
+        for name, status in state.get_container("opencti").service_statuses.items()
+        if name.startswith("platform") and status == ops.pebble.ServiceStatus.ACTIVE
+    }
+    state = dataclasses.replace(state, config={**state.config, **changed_config})
+
+    state_out = ctx.run(
+        ctx.on.config_changed(), _with_peer_data(state, {"restart-unit": "opencti/0"}, {0: {}})
+    )
+
+    assert state_out.unit_status == ops.WaitingStatus("waiting for rolling restart")
+    statuses = state_out.get_container("opencti").service_statuses
+    assert len(running) > 1
+    assert all(statuses[name] == ops.pebble.ServiceStatus.ACTIVE for name in running)
+
+
+@pytest.mark.parametrize(
+    "granted, peers_data, expected_granted",
+    [
+        pytest.param("", {1: {}, 2: {}}, None, id="no-request"),
+        pytest.param(
+            "",
+            {1: {"restart-request": "true"}, 2: {"restart-request": "true"}},
+            "opencti/1",
+            id="grant-first",
+        ),
+        pytest.param(
+            "opencti/2",
+            {1: {"restart-request": "true"}, 2: {"restart-request": "true"}},
+            "opencti/2",
+            id="lock-held",
+        ),
+        pytest.param(
+            "opencti/2", {1: {"restart-request": "true"}, 2: {}}, "opencti/1", id="lock-released"
+        ),
+        pytest.param("opencti/2", {1: {}}, None, id="lock-holder-departed"),
+    ],
+)
+def test_rolling_restart_lock(granted, peers_data, expected_granted):
+    """
+    arrange: provide the leader with peer units requesting the rolling restart lock.
+    act: simulate a peer relation-changed event.
+    assert: the leader grants the lock to one requesting unit at a time.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    state_in = _with_peer_data(state_in, {"restart-unit": granted} if granted else {}, peers_data)
+
+    state_out = ctx.run(
+        ctx.on.relation_changed(state_in.get_relations("opencti-peer")[0]), state_in
+    )
+
+    app_data = typing.cast(dict, state_out.get_relations("opencti-peer")[0].local_app_data)
+    assert app_data.get("restart-unit") == expected_granted
+
+
+def test_worker_count_decrease():
+    """
+    arrange: run the charm with the default worker count.
+    act: decrease the worker-count configuration.
+    assert: surplus workers are stopped and disabled.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    state = ctx.run(ctx.on.config_changed(), state_in)
+
+    state_out = ctx.run(
+        ctx.on.config_changed(),
+        dataclasses.replace(state, config={**state.config, "worker-count": "1"}),
+    )
+
+    container = state_out.get_container("opencti")
+    assert container.service_statuses["worker-0"] == ops.pebble.ServiceStatus.ACTIVE
+    for name in ("worker-1", "worker-2"):
+        assert container.service_statuses[name] == ops.pebble.ServiceStatus.INACTIVE
+        assert container.plan.services[name].startup == "disabled"
+        assert container.plan.checks[name].exec == {"command": "true"}
+
+
+@pytest.mark.parametrize("worker_count", ["0", "many"])
+def test_invalid_worker_count(worker_count):
+    """
+    arrange: provide the charm with an invalid worker-count configuration.
+    act: simulate a config-changed event.
+    assert: the charm is blocked.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("worker-count", worker_count)
+        .build()
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    assert state_out.unit_status == ops.BlockedStatus("invalid charm config: worker-count")
+
+
+@pytest.mark.parametrize(
+    "backlog, expected_workers",
+    [
+        pytest.param(0, 2, id="minimum"),
+        pytest.param(5500, 6, id="scale-up"),
+        pytest.param(100000, 8, id="maximum"),
+    ],
+)
+def test_worker_autoscaling(backlog, expected_workers):
+    """
+    arrange: provide the charm with worker autoscaling configurations and a queue backlog.
+    act: simulate an update-status event.
+    assert: the number of workers is scaled according to the backlog.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("worker-count", "2")
+        .set_config("worker-autoscale-max", 8)  # type: ignore[arg-type]
+        .build()
+    )
+
+    with unittest.mock.patch("autoscaler.get_queue_backlog", return_value=backlog) as backlog_:
+        state_out = ctx.run(ctx.on.update_status(), state_in)
+
+    assert backlog_.call_args.args[0] == "http://10.212.71.5:15672"
+    container = state_out.get_container("opencti")
+    workers = [name for name in container.plan.services if name.startswith("worker-")]
+    assert len(workers) == expected_workers
+
+
+def test_worker_autoscaling_container_not_ready():
+    """
+    arrange: provide the charm with automatic worker count and the opencti container not ready.
+    act: simulate an update-status event.
+    assert: the charm waits for the opencti container without polling the queue backlog.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder(can_connect=False)
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("worker-count", "auto")
+        .set_config("worker-autoscale-max", 8)  # type: ignore[arg-type]
+        .build()
+    )
+
+    with unittest.mock.patch("autoscaler.get_queue_backlog") as backlog_:
+        state_out = ctx.run(ctx.on.update_status(), state_in)
+
+    backlog_.assert_not_called()
+    assert state_out.unit_status == ops.WaitingStatus("waiting for opencti container")
+
+
+@pytest.mark.parametrize(
+    "backlog, expected_backpressure",
+    [
+        pytest.param(0, "none", id="idle"),
+        pytest.param(100000, "high", id="saturated"),
+    ],
+)
+def test_connector_backpressure(backlog, expected_backpressure):
+    """
+    arrange: provide the charm with an opencti-connector integration and a queue backlog.
+    act: simulate an update-status event.
+    assert: the backpressure level is published to the connector integration.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    integration = ops.testing.Relation(
+        endpoint="opencti-connector",
+        remote_app_data={
+            "connector_charm_name": "alienvault",
+            "connector_type": "EXTERNAL_IMPORT",
+        },
+    )
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .add_integration(integration)
+        .build()
+    )
+
+    with unittest.mock.patch("autoscaler.get_queue_backlog", return_value=backlog):
+        state_out = ctx.run(ctx.on.update_status(), state_in)
+
+    data = typing.cast(dict, state_out.get_relation(integration.id).local_app_data)
+    assert data["backpressure"] == expected_backpressure
+
+
+def test_pebble_plan_unchanged():
+    """
+    arrange: provide the charm with the required integrations and configurations.
+    act: simulate a config-changed event then an update-status event.
+    assert: the Pebble plan is only updated and replanned in the first event.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    with unittest.mock.patch.object(
+        ops.Container, "replan", autospec=True, side_effect=ops.Container.replan
+    ) as replan:
+        state = ctx.run(ctx.on.config_changed(), state_in)
+        assert replan.call_count == 2
+        replan.reset_mock()
+        state_out = ctx.run(ctx.on.update_status(), state)
+
+    replan.assert_not_called()
+    assert state_out.get_container("opencti").plan == state.get_container("opencti").plan
+    assert state_out.unit_status.name == "active"
 
 
 @pytest.mark.parametrize(
     "missing_integration", ["opensearch-client", "amqp", "redis", "s3", "ingress", "opencti-peer"]
 )
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_missing_integration(missing_integration):
     """
     arrange: set up the charm with a missing required integration.
@@ -159,7 +820,6 @@ def test_missing_integration(missing_integration):
 
 
 @pytest.mark.parametrize("missing_config", ["admin-user"])
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_missing_config(missing_config):
     """
     arrange: set up the charm with a missing required configuration.
@@ -178,7 +838,6 @@ def test_missing_config(missing_config):
     assert state_out.unit_status.message == "missing charm config: admin-user"
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_invalid_admin_user_not_a_secret():
     """
     arrange: set up the charm with admin-user contains a value that's not a juju user secret id.
@@ -198,7 +857,6 @@ def test_invalid_admin_user_not_a_secret():
     assert state_out.unit_status.message == "admin-user config is not a secret"
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_invalid_admin_user_invalid_content():
     """
     arrange: set up the charm with admin-user configuration with incorrect permission setting.
@@ -221,7 +879,6 @@ def test_invalid_admin_user_invalid_content():
 
 
 @pytest.mark.parametrize("leader", [True, False])
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_amqp_request_admin_user(leader):
     """
     arrange: none.
@@ -237,21 +894,114 @@ def test_amqp_request_admin_user(leader):
         assert data["admin"] == "true"
 
 
-def test_opencti_wait_platform_start(patch_is_platform_healthy):
+@pytest.mark.parametrize(
+    "status, successes",
+    [
+        pytest.param(ops.pebble.CheckStatus.DOWN, 0, id="down"),
+        pytest.param(ops.pebble.CheckStatus.UP, 0, id="no-success-yet"),
+    ],
+)
+def test_opencti_wait_platform_start(status, successes):
     """
-    arrange: provide the charm with the required integrations and configurations.
-    act: simulate a config-changed event.
-    assert: charm set the correct status message during opencti platform start-up.
+    arrange: provide the charm with a platform Pebble check that isn't passing.
+    act: simulate a check-failed event, then a check-recovered event.
+    assert: charm waits for the opencti platform to start, then becomes active once the
+        check recovers.
     """
-    patch_is_platform_healthy.return_value = False
     ctx = ops.testing.Context(OpenCTICharm)
     state_in = StateBuilder().add_required_integrations().add_required_configs().build()
-    state_out = ctx.run(ctx.on.config_changed(), state_in)
-    assert state_out.unit_status.name == "waiting"
-    assert state_out.unit_status.message == "waiting for opencti platform to start"
+    state = ctx.run(ctx.on.config_changed(), state_in)
+    container = state.get_container("opencti")
+    check = dataclasses.replace(
+        container.get_check_info("platform"), status=status, successes=successes
+    )
+    container = dataclasses.replace(container, check_infos={check})
+
+    state = ctx.run(
+        ctx.on.pebble_check_failed(container, check),
+        dataclasses.replace(state, containers={container}),
+    )
+
+    assert state.unit_status.name == "waiting"
+    assert state.unit_status.message == "waiting for opencti platform to start"
+
+    recovered = dataclasses.replace(check, status=ops.pebble.CheckStatus.UP, successes=1)
+    container = dataclasses.replace(state.get_container("opencti"), check_infos={recovered})
+    state_out = ctx.run(
+        ctx.on.pebble_check_recovered(container, recovered),
+        dataclasses.replace(state, containers={container}),
+    )
+
+    assert state_out.unit_status.name == "active"
+
+
+@pytest.mark.parametrize(
+    "platform_status, restarted",
+    [
+        pytest.param(ops.pebble.CheckStatus.UP, True, id="platform-up"),
+        pytest.param(ops.pebble.CheckStatus.DOWN, False, id="platform-down"),
+    ],
+)
+def test_worker_check_failed(platform_status, restarted):
+    """
+    arrange: provide the charm with running workers and a platform check with a given status.
+    act: simulate a check-failed event of a worker liveness check.
+    assert: the worker is restarted, unless the platform it connects to is unhealthy.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().add_required_integrations().add_required_configs().build()
+    state = ctx.run(ctx.on.config_changed(), state_in)
+    container = state.get_container("opencti")
+    platform = dataclasses.replace(container.get_check_info("platform"), status=platform_status)
+    worker = ops.testing.CheckInfo(
+        "worker-1",
+        level=ops.pebble.CheckLevel.ALIVE,
+        status=ops.pebble.CheckStatus.DOWN,
+        failures=3,
+        successes=0,
+    )
+    container = dataclasses.replace(container, check_infos={platform, worker})
+
+    with unittest.mock.patch.object(
+        ops.Container, "restart", autospec=True, side_effect=ops.Container.restart
+    ) as restart:
+        ctx.run(
+            ctx.on.pebble_check_failed(container, worker),
+            dataclasses.replace(state, containers={container}),
+        )
+
+    if restarted:
+        restart.assert_called_once_with(unittest.mock.ANY, "worker-1")
+    else:
+        restart.assert_not_called()
+
+
+def test_opencti_wait_platform_start_without_successes():
+    """
+    arrange: provide the charm with a just started platform check, up without successes.
+    act: simulate a config-changed event, then another one once the check has been up
+        for longer than its failure threshold.
+    assert: charm waits for the opencti platform to start, then becomes active.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder(platform_check_successes=None)
+        .add_required_integrations()
+        .add_required_configs()
+        .build()
+    )
+
+    state = ctx.run(ctx.on.config_changed(), state_in)
+
+    assert state.unit_status == ops.WaitingStatus("waiting for opencti platform to start")
+
+    state_out = ctx.run(
+        ctx.on.config_changed(), _with_platform_check_started(state, time.time() - 60)
+    )
+
+    assert state_out.unit_status.name == "active"
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_pebble_ready():
     """
     arrange: provide the charm with the opencti container not ready.
@@ -271,7 +1021,6 @@ def test_pebble_ready():
 
 
 @pytest.mark.parametrize("leader", [True, False])
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_opencti_peer_initiation(leader):
     """
     arrange: none.
@@ -291,7 +1040,6 @@ def test_opencti_peer_initiation(leader):
         assert "secret" in data
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_insecure_opensearch_integration():
     """
     arrange: provide the charm with an opensearch integration without password or TLS protection.
@@ -317,7 +1065,6 @@ def test_insecure_opensearch_integration():
 @pytest.mark.parametrize(
     "incomplete_integration", ["opensearch-client", "amqp", "redis", "s3", "ingress"]
 )
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_incomplete_integration(incomplete_integration):
     """
     arrange: provide the charm with one required integration not ready.
@@ -337,7 +1084,6 @@ def test_incomplete_integration(incomplete_integration):
     assert state_out.unit_status.message == f"waiting for {incomplete_integration} integration"
 
 
-@pytest.mark.usefixtures("patch_is_platform_healthy")
 def test_redis_library_workaround():
     """
     arrange: provide the charm with a broken redis integration.
@@ -364,6 +1110,109 @@ def test_redis_library_workaround():
     assert state_out.unit_status.message == "invalid redis integration"
 
 
+def test_opencti_worker_integration():
+    """
+    arrange: provide the charm with the required integrations and an opencti-worker integration.
+    act: simulate a config-changed event.
+    assert: the OpenCTI URL and a token secret are shared with the worker application.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    worker_integration = ops.testing.Relation(endpoint="opencti-worker")
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .add_integration(worker_integration)
+        .build()
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    data = typing.cast(dict, state_out.get_relation(worker_integration.id).local_app_data)
+    assert data["opencti_url"] == "https://opencti-endpoints.test-opencti.svc/opencti"
+    secret = state_out.get_secret(id=data["opencti_token"])
+    assert secret.tracked_content == {"token": "opencti-admin-token"}
+
+
+def test_worker_role():
+    """
+    arrange: provide the charm with role=worker and an opencti-platform integration.
+    act: simulate a config-changed event.
+    assert: only the OpenCTI workers run, connected to the remote OpenCTI platform.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    token_secret = ops.testing.Secret(tracked_content={"token": "remote-token"})
+    state_in = (
+        StateBuilder()
+        .set_config("role", "worker")
+        .set_config("worker-count", "2")
+        .add_secret(token_secret)
+        .add_integration(
+            ops.testing.Relation(
+                endpoint="opencti-platform",
+                remote_app_data={
+                    "opencti_url": "https://opencti.example.com/opencti",
+                    "opencti_token": token_secret.id,
+                },
+            )
+        )
+        .build()
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    assert state_out.unit_status.name == "active"
+    services = state_out.get_container("opencti").plan.services
+    assert sorted(services) == ["worker-0", "worker-1"]
+    assert services["worker-0"].environment == {
+        "OPENCTI_URL": "https://opencti.example.com/opencti",
+        "OPENCTI_TOKEN": "remote-token",
+        "WORKER_LOG_LEVEL": "info",
+    }
+    assert not services["worker-0"].requires
+    checks = state_out.get_container("opencti").plan.checks
+    assert checks["worker-1"].level == ops.pebble.CheckLevel.ALIVE
+    assert checks["worker-1"].exec == {
+        "command": "python3 /opt/opencti-worker/charm-worker-check.py",
+        "service-context": "worker-1",
+    }
+
+
+def test_worker_role_missing_integration():
+    """
+    arrange: provide the charm with role=worker and no opencti-platform integration.
+    act: simulate a config-changed event.
+    assert: the charm is blocked.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = StateBuilder().set_config("role", "worker").build()
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    assert state_out.unit_status == ops.BlockedStatus("missing integration(s): opencti-platform")
+
+
+def test_platform_role():
+    """
+    arrange: provide the charm with role=platform and the required integrations.
+    act: simulate a config-changed event.
+    assert: only the OpenCTI platform runs.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .set_config("role", "platform")
+        .build()
+    )
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    assert state_out.unit_status.name == "active"
+    assert sorted(state_out.get_container("opencti").plan.services) == ["platform"]
+
+
 def test_opencti_connector(patch_opencti_client):
     """
     arrange: provide the charm with the required integrations and configurations.
@@ -398,6 +1247,163 @@ def test_opencti_connector(patch_opencti_client):
     assert secret.tracked_content == {"token": "00000000-0000-0000-0000-000000000000"}
 
 
+@pytest.mark.parametrize(
+    "event_name, elapsed, expect_requests",
+    [
+        pytest.param("update_status", 0, False, id="cache-hit"),
+        pytest.param("update_status", 3600, True, id="cache-expired"),
+        pytest.param("relation_changed", 0, True, id="relation-changed"),
+    ],
+)
+def test_opencti_connector_user_cache(
+    patch_opencti_client, monkeypatch, event_name, elapsed, expect_requests
+):
+    """
+    arrange: reconcile the connector users once.
+    act: simulate another event, after some time.
+    assert: the OpenCTI API is only queried when the cache expires or is invalidated.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    opencti_connector_integration = ops.testing.Relation(
+        endpoint="opencti-connector",
+        remote_app_data={"connector_type": "STREAM", "connector_charm_name": "test"},
+    )
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .add_integration(opencti_connector_integration)
+        .build()
+    )
+    monkeypatch.setattr("time.time", lambda: 1000.0)
+    state = ctx.run(ctx.on.config_changed(), state_in)
+    client_class = type(patch_opencti_client)
+    monkeypatch.setattr(client_class, "last_instance", None)
+    monkeypatch.setattr("time.time", lambda: 1000.0 + elapsed)
+
+    if event_name == "relation_changed":
+        event = ctx.on.relation_changed(state.get_relation(opencti_connector_integration.id))
+    else:
+        event = ctx.on.update_status()
+    state_out = ctx.run(event, state)
+
+    assert state_out.unit_status.name == "active"
+    assert (client_class.last_instance is not None) == expect_requests
+
+
+@pytest.mark.parametrize(
+    "remote_app_data, expect_fast_path",
+    [
+        pytest.param({"connector_type": "STREAM"}, True, id="unchanged"),
+        pytest.param({"connector_type": "INTERNAL_ENRICHMENT"}, False, id="type-changed"),
+    ],
+)
+def test_opencti_connector_fast_path(remote_app_data, expect_fast_path):
+    """
+    arrange: reconcile the connector users once then update the connector integration data.
+    act: simulate an update-status event.
+    assert: connector reconciliation is skipped only if the integrations are unchanged.
+    """
+    ctx = ops.testing.Context(OpenCTICharm)
+    opencti_connector_integration = ops.testing.Relation(
+        endpoint="opencti-connector",
+        remote_app_data={"connector_type": "STREAM", "connector_charm_name": "test"},
+    )
+    state_in = (
+        StateBuilder()
+        .add_required_integrations()
+        .add_required_configs()
+        .add_integration(opencti_connector_integration)
+        .build()
+    )
+    state = ctx.run(ctx.on.config_changed(), state_in)
+    relation = typing.cast(
+        ops.testing.Relation, state.get_relation(opencti_connector_integration.id)
+    )
+    state = dataclasses.replace(
+        state,
+        relations=[r for r in state.relations if r.id != relation.id]
+        + [
+            dataclasses.replace(
+                relation, remote_app_data={**relation.remote_app_data, **remote_app_data}
+            )
+        ],
+    )
+
+    with unittest.mock.patch.object(
+        OpenCTICharm, "_get_connector_integrations", autospec=True, return_value=[]
+    ) as get_connector_integrations:
+        state_out = ctx.run(ctx.on.update_status(), state)
+
+    assert get_connector_integrations.called != expect_fast_path
+    stored = next(
+        s
+        for s in state_out.stored_states
+        if s.owner_path == "OpenCTICharm" and s.name == "_stored"
+    ).content
+    assert stored["connector_reconcile_count"] == 2
+    assert stored["connector_fast_path_count"] == (1 if expect_fast_path else 0)
+
+
+def test_opencti_connector_users_diff(patch_opencti_client):
+    """
+    arrange: provide the charm with connector integrations, an inactive and a stale user.
+    act: simulate a config-changed event.
+    assert: the opencti charm creates, activates and deactivates connector users in batches,
+        only the group of the created user is looked up.
+    """
+    # pylint: disable=protected-access
+    patch_opencti_client._users.extend(
+        [
+            {
+                "id": "inactive-user",
+                "name": "charm-connector-inactive",
+                "user_email": "charm-connector-inactive@opencti.local",
+                "account_status": "Inactive",
+                "api_token": "inactive-user-token",
+            },
+            {
+                "id": "stale-user",
+                "name": "charm-connector-stale",
+                "user_email": "charm-connector-stale@opencti.local",
+                "account_status": "Active",
+                "api_token": "stale-user-token",
+            },
+        ]
+    )
+    ctx = ops.testing.Context(OpenCTICharm)
+    state_builder = StateBuilder().add_required_integrations().add_required_configs()
+    for name in ("inactive", "new"):
+        state_builder.add_integration(
+            ops.testing.Relation(
+                endpoint="opencti-connector",
+                remote_app_name=name,
+                remote_app_data={"connector_type": "STREAM", "connector_charm_name": name},
+            )
+        )
+    client_class = type(patch_opencti_client)
+    with (
+        unittest.mock.patch.object(
+            client_class, "create_user", wraps=patch_opencti_client.create_user
+        ) as create_user,
+        unittest.mock.patch.object(
+            client_class, "set_account_statuses", autospec=True
+        ) as set_account_statuses,
+        unittest.mock.patch.object(
+            client_class, "get_group", wraps=patch_opencti_client.get_group
+        ) as get_group,
+    ):
+        state_out = ctx.run(ctx.on.config_changed(), state_builder.build())
+    assert state_out.unit_status.name == "active"
+    get_group.assert_called_once_with("Connectors")
+    create_user.assert_called_once_with(
+        "charm-connector-new", groups=["f4fb5f8d-91f5-441e-8ef9-93c283476110"]
+    )
+    set_account_statuses.assert_called_once_with(
+        unittest.mock.ANY, {"inactive-user": "Active", "stale-user": "Inactive"}
+    )
+
+
 def test_client_params(patch_opencti_client):
     """
     arrange: provide the charm with the required integrations and configurations.
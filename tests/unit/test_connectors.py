@@ -5,10 +5,17 @@
 
 """Unit tests for connectors."""
 
+# pylint: disable=too-many-lines
+
+import dataclasses
 import importlib
+import pathlib
+import typing
+import unittest.mock
 
 import ops.testing
 import pytest
+from charms.opencti.v0 import opencti_connector
 
 from connectors.export_file_stix.src.charm import OpenctiExportFileStixConnectorCharm
 from tests.unit.state import ConnectorStateBuilder
@@ -815,3 +822,316 @@ def test_proxy_environment(monkeypatch):
             }
         }
     }
+
+
+def test_config_options_loaded_once():
+    """
+    arrange: clear the cached connector configuration options.
+    act: simulate two config-changed events on a connector charm.
+    assert: the connector configuration options are parsed once and shared by the validation
+        and the environment generation.
+    """
+    opencti_connector.load_config_options.cache_clear()
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = (
+        ConnectorStateBuilder("opencti-export-file-stix-connector")
+        .add_opencti_connector_integration()
+        .set_config("connector-scope", "application/vnd.oasis.stix+json")
+        .set_config("connector-confidence-level", 100)
+        .build()
+    )
+
+    ctx.run(ctx.on.config_changed(), state_in)
+    ctx.run(ctx.on.config_changed(), state_in)
+
+    cache_info = opencti_connector.load_config_options.cache_info()
+    assert cache_info.misses == 1
+    assert cache_info.hits == 3
+    options = opencti_connector.load_config_options(
+        pathlib.Path("connectors/export_file_stix").absolute()
+    )
+    assert opencti_connector.ConnectorOption(name="connector-scope", required=True) in options
+
+
+def test_connector_env_name_override():
+    """
+    arrange: override the conversion of the configuration names to environment variable names.
+    act: simulate a config-changed event on a connector charm.
+    assert: the connector environment variables are named by the overridden conversion.
+    """
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = (
+        ConnectorStateBuilder("opencti-export-file-stix-connector")
+        .add_opencti_connector_integration()
+        .set_config("connector-scope", "application/vnd.oasis.stix+json")
+        .set_config("connector-confidence-level", 100)
+        .build()
+    )
+
+    with unittest.mock.patch.object(
+        OpenctiExportFileStixConnectorCharm,
+        "kebab_to_constant",
+        autospec=True,
+        side_effect=lambda _, name: "STIX_" + name.replace("-", "_").upper(),
+    ):
+        state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    container = state_out.get_container("opencti-export-file-stix-connector")
+    environment = container.plan.services["connector"].environment
+    assert environment["STIX_CONNECTOR_SCOPE"] == "application/vnd.oasis.stix+json"
+    assert "CONNECTOR_SCOPE" not in environment
+
+
+@pytest.mark.parametrize(
+    "connector_name, expect_running",
+    [
+        pytest.param("urlscan-enrichment", True, id="internal-enrichment"),
+        pytest.param("import-document", True, id="internal-import-file"),
+        pytest.param("alienvault", False, id="external-import"),
+    ],
+)
+def test_connector_multi_unit(connector_name, expect_running):
+    """
+    arrange: provide a non-leader connector unit with the connector ID in the peer integration.
+    act: simulate a config-changed event.
+    assert: queue-consuming connectors run on every unit with the shared connector ID, other
+        connectors only run on the leader.
+    """
+    name = f"opencti-{connector_name}-connector"
+    charm_module = importlib.import_module(
+        f"connectors.{_kebab_to_snake(connector_name)}.src.charm"
+    )
+    charm_class = getattr(charm_module, _kebab_to_pascal(name) + "Charm")
+    ctx = ops.testing.Context(charm_class)
+    charm_config = next(p.values[1] for p in _CONNECTOR_TEST_PARAMS if p.id == connector_name)
+    state_builder = ConnectorStateBuilder(name).add_opencti_connector_integration()
+    for config_key, config_value in charm_config.items():
+        state_builder = state_builder.set_config(config_key, config_value)
+    state_in = state_builder.build()
+    peer = ops.testing.PeerRelation(
+        endpoint="opencti-connector-peer",
+        local_app_data={"connector_id": "7b0c4e0c-4c56-4be4-8e1b-9ec2f5ecb7a7"},
+    )
+    state_in = dataclasses.replace(state_in, leader=False, relations={*state_in.relations, peer})
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    services = state_out.get_container(name).plan.services
+    if expect_running:
+        assert state_out.unit_status == ops.ActiveStatus()
+        environment = services["connector"].environment
+        assert environment["CONNECTOR_ID"] == "7b0c4e0c-4c56-4be4-8e1b-9ec2f5ecb7a7"
+    else:
+        assert state_out.unit_status == ops.ActiveStatus(
+            "standby, the connector runs on the leader"
+        )
+        assert "connector" not in services
+
+
+def test_connector_leader_elected():
+    """
+    arrange: provide a connector unit with the peer integration.
+    act: simulate a leader-elected event.
+    assert: the new leader announces itself as the unit running the connector to its peers.
+    """
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = (
+        ConnectorStateBuilder("opencti-export-file-stix-connector")
+        .add_opencti_connector_integration()
+        .set_config("connector-scope", "application/vnd.oasis.stix+json")
+        .build()
+    )
+    peer = ops.testing.PeerRelation(endpoint="opencti-connector-peer")
+    state_in = dataclasses.replace(state_in, relations={*state_in.relations, peer})
+
+    state_out = ctx.run(ctx.on.leader_elected(), state_in)
+
+    peer_data = typing.cast(dict, state_out.get_relation(peer.id).local_app_data)
+    assert peer_data["active-unit"] == "opencti-export-file-stix-connector/0"
+    assert state_out.unit_status == ops.ActiveStatus()
+
+
+def test_connector_previous_leader_standby():
+    """
+    arrange: provide a former leader unit still running the connector, with invalid config.
+    act: simulate a peer relation-changed event from the new leader.
+    assert: the previous leader stops its connector and goes to standby.
+    """
+    name = "opencti-export-file-stix-connector"
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = ConnectorStateBuilder(name).add_opencti_connector_integration().build()
+    container = ops.testing.Container(  # type: ignore
+        name=name,
+        can_connect=True,
+        layers={
+            "connector": ops.pebble.Layer(
+                {"services": {"connector": {"override": "replace", "command": "connector"}}}
+            )
+        },
+        service_statuses={"connector": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    peer = ops.testing.PeerRelation(
+        endpoint="opencti-connector-peer",
+        local_app_data={
+            "connector_id": "7b0c4e0c-4c56-4be4-8e1b-9ec2f5ecb7a7",
+            "active-unit": f"{name}/1",
+        },
+        peers_data={1: {}},
+    )
+    state_in = dataclasses.replace(
+        state_in, leader=False, containers={container}, relations={*state_in.relations, peer}
+    )
+
+    state_out = ctx.run(ctx.on.relation_changed(peer, remote_unit=1), state_in)
+
+    assert state_out.unit_status == ops.ActiveStatus("standby, the connector runs on the leader")
+    service_status = state_out.get_container(name).service_statuses["connector"]
+    assert service_status == ops.pebble.ServiceStatus.INACTIVE
+
+
+def test_connector_id_shared_with_peers():
+    """
+    arrange: provide the leader connector unit with an existing connector ID.
+    act: simulate a config-changed event.
+    assert: the leader shares the existing connector ID with the other units.
+    """
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = (
+        ConnectorStateBuilder("opencti-export-file-stix-connector")
+        .add_opencti_connector_integration()
+        .set_config("connector-scope", "application/vnd.oasis.stix+json")
+        .build()
+    )
+    integration = next(iter(state_in.relations))
+    integration = dataclasses.replace(
+        integration, local_app_data={"connector_id": "7b0c4e0c-4c56-4be4-8e1b-9ec2f5ecb7a7"}
+    )
+    peer = ops.testing.PeerRelation(endpoint="opencti-connector-peer")
+    state_in = dataclasses.replace(state_in, relations={integration, peer})
+
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+
+    peer_data = typing.cast(dict, state_out.get_relation(peer.id).local_app_data)
+    assert peer_data["connector_id"] == "7b0c4e0c-4c56-4be4-8e1b-9ec2f5ecb7a7"
+
+
+def test_connector_processes():
+    """
+    arrange: provide a file import connector charm with the connector-processes configuration.
+    act: simulate a config-changed event, then decrease connector-processes.
+    assert: one Pebble service runs per connector process with the same connector
+        registration, surplus connector processes are stopped and disabled.
+    """
+    name = "opencti-import-file-stix-connector"
+    charm_module = importlib.import_module("connectors.import_file_stix.src.charm")
+    ctx = ops.testing.Context(charm_module.OpenctiImportFileStixConnectorCharm)
+    state_builder = ConnectorStateBuilder(name).add_opencti_connector_integration()
+    charm_config = next(p.values[1] for p in _CONNECTOR_TEST_PARAMS if p.id == "import-file-stix")
+    for config_key, config_value in charm_config.items():
+        state_builder = state_builder.set_config(config_key, config_value)
+    state_in = state_builder.set_config("connector-processes", 3).build()
+
+    state = ctx.run(ctx.on.config_changed(), state_in)
+
+    container = state.get_container(name)
+    names = ["connector", "connector-1", "connector-2"]
+    assert sorted(container.plan.services) == names
+    environments = [container.plan.services[n].environment for n in names]
+    assert all(environment == environments[0] for environment in environments)
+    assert "CONNECTOR_PROCESSES" not in environments[0]
+    assert all(container.service_statuses[n] == ops.pebble.ServiceStatus.ACTIVE for n in names)
+
+    state_out = ctx.run(
+        ctx.on.config_changed(),
+        dataclasses.replace(state, config={**state.config, "connector-processes": 1}),
+    )
+
+    container = state_out.get_container(name)
+    assert container.service_statuses["connector"] == ops.pebble.ServiceStatus.ACTIVE
+    for surplus in ("connector-1", "connector-2"):
+        assert container.plan.services[surplus].startup == "disabled"
+        assert container.service_statuses[surplus] == ops.pebble.ServiceStatus.INACTIVE
+
+
+def test_connector_unchanged():
+    """
+    arrange: run a connector charm.
+    act: simulate an update-status event, then a secret-changed event for a new token.
+    assert: the connector is only replanned when its environment changes, and the token secret
+        is only refreshed on secret-changed.
+    """
+    ctx = ops.testing.Context(OpenctiExportFileStixConnectorCharm)
+    state_in = (
+        ConnectorStateBuilder("opencti-export-file-stix-connector")
+        .add_opencti_connector_integration()
+        .set_config("connector-scope", "application/vnd.oasis.stix+json")
+        .build()
+    )
+    state = ctx.run(ctx.on.config_changed(), state_in)
+    secret = next(iter(state.secrets))
+    state = dataclasses.replace(
+        state,
+        secrets={
+            dataclasses.replace(
+                secret,
+                latest_content={"token": "11111111-1111-1111-1111-111111111111"},
+            )
+        },
+    )
+
+    with unittest.mock.patch.object(ops.Container, "replan") as replan:
+        state = ctx.run(ctx.on.update_status(), state)
+
+    replan.assert_not_called()
+    container = state.get_container("opencti-export-file-stix-connector")
+    environment = container.plan.services["connector"].environment
+    assert environment["OPENCTI_TOKEN"] == "00000000-0000-0000-0000-000000000000"
+
+    state_out = ctx.run(ctx.on.secret_changed(next(iter(state.secrets))), state)
+
+    container = state_out.get_container("opencti-export-file-stix-connector")
+    environment = container.plan.services["connector"].environment
+    assert environment["OPENCTI_TOKEN"] == "11111111-1111-1111-1111-111111111111"
+
+
+@pytest.mark.parametrize(
+    "connector_name, backpressure, expected_threshold",
+    [
+        pytest.param("alienvault", "none", None, id="none"),
+        pytest.param("alienvault", "elevated", "100", id="elevated"),
+        pytest.param("alienvault", "high", "10", id="high"),
+        pytest.param("export-file-stix", "high", None, id="not-importing"),
+    ],
+)
+def test_connector_backpressure(connector_name, backpressure, expected_threshold):
+    """
+    arrange: run the connector charm without backpressure from the OpenCTI charm.
+    act: simulate a relation-changed event publishing a backpressure level.
+    assert: importing connectors are restarted to buffer their bundles at a lower queue size
+        under backpressure, other connectors aren't restarted.
+    """
+    name = f"opencti-{connector_name}-connector"
+    charm_module = importlib.import_module(
+        f"connectors.{_kebab_to_snake(connector_name)}.src.charm"
+    )
+    ctx = ops.testing.Context(getattr(charm_module, _kebab_to_pascal(name) + "Charm"))
+    state_builder = ConnectorStateBuilder(name).add_opencti_connector_integration()
+    charm_config = next(p.values[1] for p in _CONNECTOR_TEST_PARAMS if p.id == connector_name)
+    for config_key, config_value in charm_config.items():
+        state_builder = state_builder.set_config(config_key, config_value)
+    state = ctx.run(ctx.on.config_changed(), state_builder.build())
+    integration = typing.cast(ops.testing.Relation, next(iter(state.relations)))
+    integration = dataclasses.replace(
+        integration,
+        remote_app_data={**integration.remote_app_data, "backpressure": backpressure},
+    )
+
+    with unittest.mock.patch.object(ops.Container, "replan") as replan:
+        state_out = ctx.run(
+            ctx.on.relation_changed(integration),
+            dataclasses.replace(state, relations={integration}),
+        )
+
+    assert replan.called == (expected_threshold is not None)
+    environment = state_out.get_container(name).plan.services["connector"].environment
+    assert environment.get("CONNECTOR_QUEUE_THRESHOLD") == expected_threshold
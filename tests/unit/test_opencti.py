@@ -0,0 +1,423 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Unit tests for the OpenCTI client."""
+
+import asyncio
+import hashlib
+import http.server
+import json
+import threading
+import time
+import typing
+import unittest.mock
+
+import gql.transport.exceptions
+import graphql
+import pytest
+
+import opencti
+from opencti import AsyncOpenctiClient, OpenctiClient
+from scripts import gen_opencti_schema
+
+
+@pytest.fixture(name="schema_paths")
+def schema_paths_fixture(tmp_path, monkeypatch):
+    """Redirect the OpenCTI schema files to a temporary directory."""
+    sdl_path = tmp_path / "opencti.graphql"
+    sdl_path.write_text("type Query { me: User }\ntype User { id: ID! }\n", encoding="utf-8")
+    introspection_path = tmp_path / "opencti.graphql.json"
+    monkeypatch.setattr(opencti, "_SCHEMA_SDL_PATH", sdl_path)
+    monkeypatch.setattr(opencti, "_SCHEMA_INTROSPECTION_PATH", introspection_path)
+    opencti.load_schema.cache_clear()
+    yield sdl_path, introspection_path
+    opencti.load_schema.cache_clear()
+
+
+def test_load_serialized_schema(schema_paths):
+    """
+    arrange: serialize the GraphQL schema.
+    act: load the GraphQL schema.
+    assert: the schema is built from the serialized schema and shared between calls.
+    """
+    _, introspection_path = schema_paths
+    opencti.dump_schema()
+    assert "sdl_sha256" in json.loads(introspection_path.read_text(encoding="utf-8"))
+
+    schema = opencti.load_schema()
+
+    assert "User" in schema.type_map
+    assert opencti.load_schema() is schema
+
+
+def test_load_outdated_serialized_schema(schema_paths):
+    """
+    arrange: serialize the GraphQL schema then update the SDL file.
+    act: load the GraphQL schema.
+    assert: the outdated serialized schema is ignored.
+    """
+    sdl_path, _ = schema_paths
+    opencti.dump_schema()
+    sdl_path.write_text("type Query { me: Group }\ntype Group { id: ID! }\n", encoding="utf-8")
+
+    schema = opencti.load_schema()
+
+    assert "Group" in schema.type_map
+    assert "User" not in schema.type_map
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        pytest.param('{"sdl_sha256": "', id="truncated"),
+        pytest.param("{}", id="missing-keys"),
+        pytest.param(None, id="invalid-introspection"),
+    ],
+)
+def test_load_corrupt_serialized_schema(schema_paths, content):
+    """
+    arrange: serialize the GraphQL schema then corrupt the serialized schema.
+    act: load the GraphQL schema.
+    assert: the corrupt serialized schema is ignored and the SDL file is parsed.
+    """
+    sdl_path, introspection_path = schema_paths
+    if content is None:
+        sdl_sha256 = hashlib.sha256(sdl_path.read_bytes()).hexdigest()
+        content = json.dumps({"sdl_sha256": sdl_sha256, "introspection": {"__schema": 1}})
+    introspection_path.write_text(content, encoding="utf-8")
+
+    schema = opencti.load_schema()
+
+    assert "User" in schema.type_map
+
+
+def test_operations_valid():
+    """
+    arrange: none.
+    act: validate the static GraphQL operations.
+    assert: all operations are valid against the OpenCTI GraphQL schema.
+    """
+    opencti.validate_operations.cache_clear()
+    opencti.validate_operations()
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_client_execute_operation(validate):
+    """
+    arrange: create an OpenCTI client with a mocked gql client.
+    act: set the account status of a user.
+    assert: the static operation is sent with the input as GraphQL variables, the operations
+        are only validated when requested.
+    """
+    opencti.validate_operations.cache_clear()
+    client = OpenctiClient(url="http://localhost:8080", api_token="token", validate=validate)
+    gql_client = unittest.mock.MagicMock()
+    client.__dict__["_session"] = gql_client
+
+    client.set_account_status("user-id", "Inactive")
+
+    request = gql_client.execute.call_args.args[0]
+    assert request.document is opencti.OPERATIONS["SetAccountStatus"]
+    assert request.variable_values == {
+        "id": "user-id",
+        "input": [{"key": "account_status", "value": ["Inactive"], "operation": "replace"}],
+    }
+    assert opencti.validate_operations.cache_info().currsize == (1 if validate else 0)
+
+
+def test_pruned_schema_up_to_date():
+    """
+    arrange: none.
+    act: generate the pruned schema from the queries in the OpenCTI client.
+    assert: the pruned schema shipped with the charm is up to date.
+    """
+    assert gen_opencti_schema.generate() == gen_opencti_schema.PRUNED_SCHEMA_PATH.read_text(
+        encoding="utf-8"
+    ), "run scripts/gen_opencti_schema.py to update the pruned schema"
+
+
+def test_prune_schema_unknown_field():
+    """
+    arrange: none.
+    act: prune a schema with a reference to a field that doesn't exist in the schema.
+    assert: ValueError is raised.
+    """
+    with pytest.raises(ValueError, match="unknown field"):
+        gen_opencti_schema.prune_schema(
+            "type Query { me: User }\ntype User { id: ID! }\n",
+            {"Query": {"me"}, "User": {"id", "name"}},
+        )
+
+
+def _user_page(names: list[str], end_cursor: str, has_next_page: bool) -> dict:
+    """Create a page of the users query result."""
+    return {
+        "users": {
+            "edges": [
+                {
+                    "node": {
+                        "id": f"{name}-id",
+                        "name": name,
+                        "user_email": f"{name}@opencti.local",
+                        "account_status": "Active",
+                        "api_token": f"{name}-token",
+                    }
+                }
+                for name in names
+            ],
+            "pageInfo": {"endCursor": end_cursor, "hasNextPage": has_next_page},
+        }
+    }
+
+
+def test_list_users_pagination():
+    """
+    arrange: create an OpenCTI client with a mocked gql client returning two pages of users.
+    act: list users.
+    assert: all pages are fetched with the configured page size and the returned cursors.
+    """
+    client = OpenctiClient(
+        url="http://localhost:8080", api_token="token", validate=False, page_size=2
+    )
+    gql_client = unittest.mock.MagicMock()
+    gql_client.execute.side_effect = [
+        _user_page(["charm-connector-a", "charm-connector-b"], "cursor-1", True),
+        _user_page(["charm-connector-c"], "cursor-2", False),
+    ]
+    client.__dict__["_session"] = gql_client
+
+    users = client.list_users(name_starts_with="charm-connector-")
+
+    assert [u.name for u in users] == [
+        "charm-connector-a",
+        "charm-connector-b",
+        "charm-connector-c",
+    ]
+    variables = [c.args[0].variable_values for c in gql_client.execute.call_args_list]
+    assert [(v["first"], v["after"]) for v in variables] == [(2, None), (2, "cursor-1")]
+    assert variables[0]["filters"]["filters"][0]["operator"] == "starts_with"
+
+
+def test_get_user():
+    """
+    arrange: create an OpenCTI client with a mocked gql client.
+    act: get a user by name.
+    assert: the user is looked up with an exact name filter on the server.
+    """
+    client = OpenctiClient(url="http://localhost:8080", api_token="token", validate=False)
+    gql_client = unittest.mock.MagicMock()
+    gql_client.execute.return_value = _user_page(["charm-connector-a"], "cursor-1", True)
+    client.__dict__["_session"] = gql_client
+
+    user = client.get_user("charm-connector-a")
+
+    assert user and user.id == "charm-connector-a-id"
+    gql_client.execute.assert_called_once()
+    name_filter = gql_client.execute.call_args.args[0].variable_values["filters"]["filters"][0]
+    assert name_filter == {
+        "key": "name",
+        "values": ["charm-connector-a"],
+        "operator": "eq",
+        "mode": "and",
+    }
+
+
+def test_set_account_statuses_batch():
+    """
+    arrange: create an OpenCTI client with a mocked gql client.
+    act: set the account status of multiple users.
+    assert: one aliased request is sent with the variables of every user.
+    """
+    client = OpenctiClient(url="http://localhost:8080", api_token="token", validate=False)
+    gql_client = unittest.mock.MagicMock()
+    gql_client.execute.return_value = {"op0": {}, "op1": {}}
+    client.__dict__["_session"] = gql_client
+
+    client.set_account_statuses({"user-1": "Active", "user-2": "Inactive"})
+
+    request = gql_client.execute.call_args.args[0]
+    assert request.document is opencti.batch_operation("SetAccountStatus", 2)
+    assert not graphql.validate(opencti.load_schema(), request.document)
+    assert request.variable_values == {
+        "id_0": "user-1",
+        "input_0": [{"key": "account_status", "value": ["Active"], "operation": "replace"}],
+        "id_1": "user-2",
+        "input_1": [{"key": "account_status", "value": ["Inactive"], "operation": "replace"}],
+    }
+
+
+def test_set_account_statuses_empty_batch():
+    """
+    arrange: create an OpenCTI client with a mocked gql client.
+    act: set the account status of no users.
+    assert: no request is sent.
+    """
+    client = OpenctiClient(url="http://localhost:8080", api_token="token", validate=False)
+    gql_client = unittest.mock.MagicMock()
+    client.__dict__["_session"] = gql_client
+
+    client.set_account_statuses({})
+
+    gql_client.execute.assert_not_called()
+
+
+class _GraphqlHandler(http.server.BaseHTTPRequestHandler):
+    """Answer every GraphQL request with an empty user page.
+
+    Attributes:
+        protocol_version: HTTP version, HTTP/1.1 keeps the connections alive.
+        delay: time in seconds spent on each request.
+        status: HTTP status of the responses, the requests are handled whatever the status.
+        handled: number of requests handled.
+        in_flight: number of requests being handled.
+        max_in_flight: maximum number of requests handled at the same time.
+        lock: lock protecting the request counters.
+    """
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    status = 200
+    handled = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self) -> None:  # noqa: N802 pylint: disable=invalid-name
+        """Handle a GraphQL request."""
+        self.rfile.read(int(self.headers["Content-Length"]))
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(cls.delay)
+        with cls.lock:
+            cls.in_flight -= 1
+            cls.handled += 1
+        if cls.status != 200:
+            body = b"gateway timeout"
+            self.send_response(cls.status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = json.dumps({"data": _user_page([], "", False)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_: typing.Any) -> None:
+        """Silence the request logs."""
+
+
+@pytest.fixture(name="graphql_server")
+def graphql_server_fixture(monkeypatch):
+    """Start a local GraphQL server with HTTP keep-alive."""
+    monkeypatch.setattr(_GraphqlHandler, "handled", 0)
+    monkeypatch.setattr(_GraphqlHandler, "in_flight", 0)
+    monkeypatch.setattr(_GraphqlHandler, "max_in_flight", 0)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _GraphqlHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_reuses_connection(graphql_server):
+    """
+    arrange: start a local GraphQL server with HTTP keep-alive.
+    act: send multiple queries with one OpenCTI client.
+    assert: all queries are sent over a single HTTP connection, which is closed on exit.
+    """
+    with OpenctiClient(url=graphql_server, api_token="token", validate=False) as client:
+        for name in ("a", "b", "c"):
+            client.get_user(name)
+        assert client.requests_sent == 3
+        assert client.connections_opened == 1
+    assert client.connections_opened == 0
+
+
+def test_client_mutation_not_retried(graphql_server, monkeypatch):
+    """
+    arrange: start a local GraphQL server answering 504 after handling each request.
+    act: send a mutation then a query with an OpenCTI client.
+    assert: the mutation is sent once, only the query is retried.
+    """
+    monkeypatch.setattr(_GraphqlHandler, "status", 504)
+
+    with OpenctiClient(url=graphql_server, api_token="token", validate=False, retries=1) as client:
+        with pytest.raises(gql.transport.exceptions.TransportServerError):
+            client.set_account_statuses({"user-1": "Inactive"})
+        assert _GraphqlHandler.handled == 1
+        with pytest.raises(gql.transport.exceptions.TransportServerError):
+            client.get_user("a")
+        assert _GraphqlHandler.handled == 3
+
+
+def test_async_client_mutation_not_retried(graphql_server, monkeypatch):
+    """
+    arrange: start a local GraphQL server answering 504 after handling each request.
+    act: send a mutation then a query with an async OpenCTI client.
+    assert: the mutation is sent once, only the query is retried.
+    """
+    monkeypatch.setattr(_GraphqlHandler, "status", 504)
+
+    async def _send(request: typing.Awaitable) -> int:
+        """Send a failing request and get the number of requests handled by the server."""
+        with pytest.raises(gql.transport.exceptions.TransportServerError):
+            await request
+        return _GraphqlHandler.handled
+
+    async def _send_all() -> list[int]:
+        """Send a mutation then a query."""
+        async with AsyncOpenctiClient(
+            url=graphql_server, api_token="token", validate=False, retries=1
+        ) as client:
+            return [
+                await _send(client.set_account_statuses({"user-1": "Inactive"})),
+                await _send(client.get_user("a")),
+            ]
+
+    assert asyncio.run(_send_all()) == [1, 3]
+
+
+def test_async_client_bounded_concurrency(graphql_server, monkeypatch):
+    """
+    arrange: start a local GraphQL server spending 0.2 seconds on each request.
+    act: send 6 queries concurrently with an async OpenCTI client limited to 3 requests.
+    assert: at most 3 requests are in flight over at most 3 connections, which are closed on
+        exit, and the queries take 2 request durations.
+    """
+    monkeypatch.setattr(_GraphqlHandler, "delay", 0.2)
+    client = AsyncOpenctiClient(
+        url=graphql_server, api_token="token", validate=False, max_concurrency=3
+    )
+
+    async def _get_users() -> tuple[list, int]:
+        """Get users concurrently."""
+        async with client:
+            users = await asyncio.gather(*(client.get_user(str(i)) for i in range(6)))
+            return users, client.connections_opened
+
+    start = time.perf_counter()
+    users, connections_opened = asyncio.run(_get_users())
+    elapsed = time.perf_counter() - start
+
+    assert users == [None] * 6
+    assert connections_opened == 3
+    assert client.connections_opened == 0
+    assert _GraphqlHandler.max_in_flight == 3
+    assert 0.4 <= elapsed < 1.0
+
+
+def test_async_client_outside_context():
+    """
+    arrange: create an async OpenCTI client.
+    act: send a query without entering the client context.
+    assert: RuntimeError is raised.
+    """
+    client = AsyncOpenctiClient(url="http://localhost:8080", api_token="token")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.list_groups())